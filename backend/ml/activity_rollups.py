@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Incrementally maintained activity rollups for RAG retrieval
+Keeps time-bucketed aggregates per (region, service, status, riskLevel):
+event count, first/last seen and distinct devices. New activities are folded
+into their bucket; the window is never recomputed from scratch.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: concurrent updates are not serialized
+    fcntl = None
+
+from ml_common import SCRIPT_DIR
+
+ROLLUP_STATE_PATH = os.path.join(SCRIPT_DIR, ".cache", "activity_rollups.json")
+
+# Bucket width (seconds)
+BUCKET_SECONDS = 60 * 60
+
+# Buckets older than this (relative to the newest activity) are evicted
+ROLLUP_WINDOW_DAYS = 30
+
+# Fields an activity is grouped by
+ROLLUP_KEY_FIELDS = ("region", "service", "status", "riskLevel")
+
+# Activity fields that identify the device, first one present wins
+DEVICE_FIELDS = ("deviceFingerprint", "deviceId", "device")
+
+# Fields that make up an activity's identity when it has no "id"
+IDENTITY_FIELDS = (
+    "type",
+    "service",
+    "location",
+    "region",
+    "status",
+    "timestamp",
+    "riskLevel",
+    "blockchainHash",
+)
+
+
+def parse_timestamp(value):
+    """ISO timestamp (or epoch seconds) -> epoch seconds, None if invalid"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def format_timestamp(seconds):
+    """Epoch seconds -> ISO timestamp (UTC)"""
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat()
+
+
+def activity_id(activity):
+    """Stable identity of an activity, used to fold each one in only once"""
+    if activity.get("id") is not None:
+        return str(activity["id"])
+    identity = "|".join(str(activity.get(f, "")) for f in IDENTITY_FIELDS)
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+
+class ActivityRollup:
+    """Time-bucketed aggregates, updated one activity at a time"""
+
+    def __init__(self, bucket_seconds=BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        # (bucket_start, region, service, status, riskLevel) -> aggregate
+        self.buckets = {}
+        # activity id -> bucket_start, so re-sent activities are skipped
+        self.seen = {}
+
+    def add(self, activity):
+        """Fold one activity into its bucket. Returns False if already seen"""
+        ts = parse_timestamp(activity.get("timestamp"))
+        if ts is None:
+            return False
+
+        key_id = activity_id(activity)
+        if key_id in self.seen:
+            return False
+
+        bucket_start = self.bucket_start(ts)
+        key = (bucket_start,) + tuple(
+            str(activity.get(f) or "غير محدد") for f in ROLLUP_KEY_FIELDS
+        )
+
+        aggregate = self.buckets.get(key)
+        if aggregate is None:
+            aggregate = {
+                "count": 0,
+                "first_seen": ts,
+                "last_seen": ts,
+                "devices": set(),
+            }
+            self.buckets[key] = aggregate
+        aggregate["count"] += 1
+        aggregate["first_seen"] = min(aggregate["first_seen"], ts)
+        aggregate["last_seen"] = max(aggregate["last_seen"], ts)
+        for field in DEVICE_FIELDS:
+            if activity.get(field):
+                aggregate["devices"].add(str(activity[field]))
+                break
+
+        self.seen[key_id] = bucket_start
+        return True
+
+    def add_many(self, activities):
+        """Fold in new activities. Returns how many were new"""
+        return sum(1 for activity in activities if self.add(activity))
+
+    def evict_before(self, cutoff):
+        """Drop buckets (and their seen ids) that start before cutoff"""
+        for key in [k for k in self.buckets if k[0] < cutoff]:
+            del self.buckets[key]
+        for key_id in [i for i, start in self.seen.items() if start < cutoff]:
+            del self.seen[key_id]
+
+    def evict_outside_window(self, window_days=ROLLUP_WINDOW_DAYS, keep_from=None):
+        """
+        Keep only buckets within window_days of the newest activity
+        keep_from: optional epoch seconds, buckets from there on are kept too
+        (so a report on an older range doesn't evict what it just added)
+        """
+        if not self.buckets:
+            return
+        newest = max(aggregate["last_seen"] for aggregate in self.buckets.values())
+        cutoff = newest - window_days * 24 * 60 * 60
+        if keep_from is not None:
+            cutoff = min(cutoff, self.bucket_start(keep_from))
+        self.evict_before(cutoff)
+
+    def bucket_start(self, ts):
+        """Start of the bucket an epoch timestamp falls into"""
+        return int(ts // self.bucket_seconds) * self.bucket_seconds
+
+    def rollups(self, start=None, end=None):
+        """
+        Current aggregates as records, newest bucket first
+        start/end: optional epoch seconds, only buckets overlapping them are kept
+        """
+        records = []
+        for key in sorted(self.buckets, key=lambda k: k[0], reverse=True):
+            if start is not None and key[0] < self.bucket_start(start):
+                continue
+            if end is not None and key[0] > end:
+                continue
+            aggregate = self.buckets[key]
+            record = dict(zip(ROLLUP_KEY_FIELDS, key[1:]))
+            record.update(
+                {
+                    "events": aggregate["count"],
+                    "first_seen": format_timestamp(aggregate["first_seen"]),
+                    "last_seen": format_timestamp(aggregate["last_seen"]),
+                    "distinct_devices": len(aggregate["devices"]),
+                }
+            )
+            records.append(record)
+        return records
+
+    # ----- persistence -----
+
+    def to_dict(self):
+        return {
+            "bucket_seconds": self.bucket_seconds,
+            "buckets": [
+                {
+                    "key": list(key),
+                    "count": aggregate["count"],
+                    "first_seen": aggregate["first_seen"],
+                    "last_seen": aggregate["last_seen"],
+                    "devices": sorted(aggregate["devices"]),
+                }
+                for key, aggregate in self.buckets.items()
+            ],
+            "seen": self.seen,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        rollup = cls(bucket_seconds=data.get("bucket_seconds", BUCKET_SECONDS))
+        for entry in data.get("buckets", []):
+            rollup.buckets[tuple(entry["key"])] = {
+                "count": entry["count"],
+                "first_seen": entry["first_seen"],
+                "last_seen": entry["last_seen"],
+                "devices": set(entry["devices"]),
+            }
+        rollup.seen = dict(data.get("seen", {}))
+        return rollup
+
+    def save(self, path=ROLLUP_STATE_PATH):
+        """Write the rollup state (temp file + rename)"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=ROLLUP_STATE_PATH, bucket_seconds=BUCKET_SECONDS):
+        """Load saved rollup state, or start empty"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls(bucket_seconds=bucket_seconds)
+        if data.get("bucket_seconds") != bucket_seconds:
+            # Bucket width changed, old aggregates can't be reused
+            return cls(bucket_seconds=bucket_seconds)
+        return cls.from_dict(data)
+
+
+def rollup_to_text(record):
+    """Render a rollup record as a "key: value | ..." knowledge text"""
+    parts = [f"{field}: {record[field]}" for field in ROLLUP_KEY_FIELDS]
+    parts.append(f"events: {record['events']}")
+    parts.append(f"first seen: {record['first_seen']}")
+    parts.append(f"last seen: {record['last_seen']}")
+    parts.append(f"distinct devices: {record['distinct_devices']}")
+    return " | ".join(parts)
+
+
+def update_rollups(activities, path=ROLLUP_STATE_PATH):
+    """
+    Fold new activities into the saved rollup state and return the rollups
+    covering the time range of these activities
+    Already seen activities are skipped, so re-sending a window is cheap
+    """
+    timestamps = [parse_timestamp(activity.get("timestamp")) for activity in activities]
+    timestamps = [ts for ts in timestamps if ts is not None]
+    if not timestamps:
+        return []
+
+    # Serialize load -> add -> save across concurrent report processes
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        rollup = ActivityRollup.load(path)
+        added = rollup.add_many(activities)
+        evicted = len(rollup.buckets)
+        rollup.evict_outside_window(keep_from=min(timestamps))
+        evicted -= len(rollup.buckets)
+        if added or evicted:
+            rollup.save(path)
+
+    # Only the request's window, not everything saved by earlier requests
+    return rollup.rollups(start=min(timestamps), end=max(timestamps))
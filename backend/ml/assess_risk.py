@@ -2,23 +2,25 @@
 """
 ML Risk Assessment Script for Shadow ID
 Loads trained models and predicts risk level for a Shadow ID scan.
+
+Usage:
+    python3 assess_risk.py '<json>'
+    echo '<json>' | python3 assess_risk.py
+    python3 assess_risk.py --serve    # one JSON request per stdin line
 """
 
 import sys
+import copy
 import json
 import os
+import hashlib
+from collections import OrderedDict
 from datetime import datetime
-import numpy as np
-import pandas as pd
 
-# ML Libraries
-import joblib
-import tensorflow as tf
-from tensorflow import keras
+from ml_common import MODELS_DIR, handle_help, lazy_import, read_json_input
 
-# Get the directory where this script is located
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-MODELS_DIR = os.path.join(SCRIPT_DIR, "../../DeepLearning_Classification/Models")
+# ML Libraries (tensorflow/joblib are imported when the models are loaded)
+np = lazy_import("numpy")
 
 # Load models
 SCALER_PATH = os.path.join(MODELS_DIR, "shadow_id_scaler.pkl")
@@ -27,6 +29,20 @@ ENCODER_PATH = os.path.join(MODELS_DIR, "shadow_id_encoder.keras")
 CLASSIFIER_PATH = os.path.join(MODELS_DIR, "shadow_id_risk_classifier_rf.pkl")
 FEATURE_NAMES_PATH = os.path.join(MODELS_DIR, "shadow_id_feature_names.json.json")
 LABEL_MAPPING_PATH = os.path.join(MODELS_DIR, "shadow_id_label_mapping.json.json")
+MANIFEST_PATH = os.path.join(MODELS_DIR, "shadow_id_model_manifest.json")
+
+# Artifacts that make up the model bundle (their stats version it without a manifest)
+MODEL_ARTIFACT_PATHS = (
+    SCALER_PATH,
+    AUTOENCODER_PATH,
+    ENCODER_PATH,
+    CLASSIFIER_PATH,
+    FEATURE_NAMES_PATH,
+    LABEL_MAPPING_PATH,
+)
+
+# Exact feature-vector result cache size (least recently used evicted, 0 = off)
+RESULT_CACHE_SIZE = int(os.environ.get("SHADOWID_RISK_CACHE_SIZE", 4096))
 
 # Load models (lazy loading - only load once)
 _models_loaded = False
@@ -37,17 +53,52 @@ _classifier = None
 _feature_names = None
 _label_mapping = None
 _reverse_label_mapping = None
+_model_version = None
+
+# Feature bytes -> assessment result, for the loaded model bundle version
+_result_cache = OrderedDict()
+_cache_hits = 0
+_cache_misses = 0
+
+
+def model_bundle_version():
+    """
+    Version of the model bundle on disk: the training manifest's version,
+    or a hash of the artifacts' mtimes and sizes when there is no manifest
+    """
+    try:
+        with open(MANIFEST_PATH, "r") as f:
+            version = json.load(f).get("version")
+        if version:
+            return str(version)
+    except (OSError, ValueError):
+        pass
+
+    digest = hashlib.sha1()
+    for path in MODEL_ARTIFACT_PATHS:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+        except OSError:
+            digest.update(f"{path}:missing".encode())
+    return digest.hexdigest()[:12]
 
 
 def load_models():
     """Load all ML models and metadata."""
     global _models_loaded, _scaler, _autoencoder, _encoder, _classifier
-    global _feature_names, _label_mapping, _reverse_label_mapping
+    global _feature_names, _label_mapping, _reverse_label_mapping, _model_version
 
     if _models_loaded:
         return
 
     try:
+        import joblib
+        from tensorflow import keras
+
+        # Read the version first so a bundle replaced mid-load is seen as changed
+        _model_version = model_bundle_version()
+
         # Load scaler
         _scaler = joblib.load(SCALER_PATH)
         print("✅ Loaded scaler", file=sys.stderr)
@@ -78,6 +129,51 @@ def load_models():
         sys.exit(1)
 
 
+def reload_models_if_changed():
+    """
+    Load the models, reloading them and dropping cached results if the
+    bundle version changed since they were loaded
+    """
+    global _models_loaded
+
+    if not _models_loaded:
+        load_models()
+        return
+
+    version = model_bundle_version()
+    if version == _model_version:
+        return
+
+    print(
+        f"Model bundle changed ({_model_version} -> {version}), reloading...",
+        file=sys.stderr,
+    )
+    _models_loaded = False
+    clear_result_cache()
+    load_models()
+
+
+def clear_result_cache():
+    """Drop all cached assessment results and reset the hit/miss counters"""
+    global _cache_hits, _cache_misses
+    _result_cache.clear()
+    _cache_hits = 0
+    _cache_misses = 0
+
+
+def result_cache_stats():
+    """Hit/miss counters and size of the feature-vector result cache"""
+    lookups = _cache_hits + _cache_misses
+    return {
+        "hits": _cache_hits,
+        "misses": _cache_misses,
+        "hitRate": _cache_hits / lookups if lookups else 0.0,
+        "size": len(_result_cache),
+        "capacity": RESULT_CACHE_SIZE,
+        "modelVersion": _model_version,
+    }
+
+
 def parse_location(location_str):
     """
     Parse location string to extract latitude and longitude.
@@ -318,10 +414,25 @@ def assess_risk(data):
         "riskProbability": { "Low": 0.0-1.0, "Medium": 0.0-1.0, "High": 0.0-1.0 }
     }
     """
+    global _cache_hits, _cache_misses
+
     try:
+        # Pick up a new model bundle before building features with its names
+        reload_models_if_changed()
+
         # Extract features
         feature_array = extract_features(data)
 
+        # Identical feature vectors get identical results: skip inference
+        cache_key = feature_array.astype(np.float32).tobytes()
+        if RESULT_CACHE_SIZE > 0:
+            cached = _result_cache.get(cache_key)
+            if cached is not None:
+                _result_cache.move_to_end(cache_key)
+                _cache_hits += 1
+                return copy.deepcopy(cached)
+            _cache_misses += 1
+
         # Scale features
         scaled_features = _scaler.transform(feature_array)
 
@@ -359,12 +470,19 @@ def assess_risk(data):
             "High": float(prob_dict["High"]),
         }
 
-        return {
+        result = {
             "riskScore": risk_score,
             "riskLevel": risk_level,
             "riskProbability": risk_probability,
         }
 
+        if RESULT_CACHE_SIZE > 0:
+            _result_cache[cache_key] = copy.deepcopy(result)
+            while len(_result_cache) > RESULT_CACHE_SIZE:
+                _result_cache.popitem(last=False)
+
+        return result
+
     except Exception as e:
         print(f"❌ Error in risk assessment: {e}", file=sys.stderr)
         import traceback
@@ -378,15 +496,34 @@ def assess_risk(data):
         }
 
 
+def serve():
+    """
+    Long-lived scoring mode: one JSON request per stdin line, one JSON result
+    per stdout line. Models and the result cache stay loaded between scans.
+    """
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            result = assess_risk(json.loads(line))
+        except json.JSONDecodeError as e:
+            result = {"error": f"Invalid JSON: {e}"}
+        print(json.dumps(result), flush=True)
+
+    print(f"Result cache: {json.dumps(result_cache_stats())}", file=sys.stderr)
+
+
 def main():
     """Main entry point - reads JSON from stdin, outputs JSON to stdout."""
-    if len(sys.argv) > 1:
-        # Read from command line argument (JSON string)
-        input_data = json.loads(sys.argv[1])
-    else:
-        # Read from stdin
-        input_json = sys.stdin.read()
-        input_data = json.loads(input_json)
+    handle_help(__doc__)
+
+    if "--serve" in sys.argv[1:]:
+        serve()
+        return
+
+    # Read from command line argument (JSON string) or stdin
+    input_data = read_json_input()
 
     # Assess risk
     result = assess_risk(input_data)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the RAG report pipeline
+Runs against the deterministic stub backend (no model downloads) and measures
+data prep, embedding, retrieval, prompt building and response parsing at
+several activity-set sizes. When the sentence-transformers model is in the
+local Hugging Face cache, it embeds the texts and builds the retrieval index
+for every stage; otherwise the stub embedder is used and the embedding stage
+is reported as "embedding_stub".
+
+Usage:
+    python3 benchmark_report_pipeline.py [--sizes 100,1000,10000,100000] [--repeat 3]
+"""
+
+import sys
+import json
+import time
+import random
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+import generate_rag_report as rag
+import generate_recommendations as recs
+import model_backends
+from model_backends import STUB_RECOMMENDATIONS, load_local_embedding_model
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+
+QUERY = "حلل لي الأنشطة الأمنية المشبوهة وأعطني توصيات عاجلة"
+
+SUMMARY = {
+    "totalUsers": 22,
+    "totalShadowIds": 20,
+    "totalActivities": 26,
+    "successRate": 100,
+    "highRiskPercentage": 5,
+    "totalAlerts": 0,
+    "unresolvedAlerts": 0,
+}
+
+
+def synthetic_activities(n, seed=42):
+    """Activity records shaped like ReportController's RAG input"""
+    rng = random.Random(seed)
+    services = ["أبشر", "توكلنا", "نفاذ", "مقيم", "غير محدد"]
+    regions = ["Riyadh", "Jeddah", "Dammam", "Makkah", "Madinah", "Tabuk"]
+    start = datetime(2025, 12, 1, tzinfo=timezone.utc)
+    activities = []
+    for i in range(n):
+        region = rng.choice(regions)
+        activities.append(
+            {
+                "type": rng.choice(["scan", "verification"]),
+                "service": rng.choice(services),
+                "location": region,
+                "region": region,
+                "status": rng.choice(["verified", "verified", "rejected"]),
+                "timestamp": (start + timedelta(seconds=37 * i)).isoformat(),
+                "riskLevel": rng.choice(["Low", "Medium", "Medium", "High"]),
+                "blockchainHash": f"0x{rng.getrandbits(128):032x}",
+            }
+        )
+    return activities
+
+
+def timed(func, repeat):
+    """Best wall time of `repeat` runs, and the last result"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_size(n, repeat, embedder=None):
+    """
+    Time each pipeline stage for n activities
+    embedder: real embedding model used for embedding and the index (None = stub)
+    """
+    activities = synthetic_activities(n)
+    if embedder is not None:
+        rag.embedding_model = embedder
+    rag.load_models()
+    stages = {}
+
+    # Data prep: DataFrame, risk filter and knowledge texts
+    def prep():
+        df = pd.DataFrame(activities)
+        mask = df["riskLevel"].astype(str).str.lower().isin(["medium", "high"])
+        return rag.build_knowledge_texts(df[mask].copy()).tolist()
+
+    stages["data_prep"], texts = timed(prep, repeat)
+
+    # Embedding (the stub is a hashed bag-of-words: its timing is not a
+    # measure of embedding cost, so it is labelled separately)
+    embedding_stage = "embedding" if embedder is not None else "embedding_stub"
+    stages[embedding_stage], _ = timed(
+        lambda: rag.embedding_model.encode(texts, show_progress_bar=False), repeat
+    )
+
+    # Full prepare_data once (prep + embedding + index) so retrieval has an index
+    rag.prepare_data(activities)
+
+    # Retrieval
+    stages["retrieval"], retrieved = timed(
+        lambda: rag.search_relevant_logs(QUERY, k=16), repeat
+    )
+
+    # Prompt building: context packing + chat messages
+    stages["prompt_building"], _ = timed(
+        lambda: rag.build_messages(QUERY, rag.build_context(retrieved)[0]), repeat
+    )
+
+    # Response parsing (recommendations parser)
+    stages["response_parsing"], _ = timed(
+        lambda: recs.parse_recommendations(STUB_RECOMMENDATIONS), repeat
+    )
+
+    # Recommendations through the stub backend (result cache bypassed)
+    stages["recommendations"], _ = timed(
+        lambda: recs.generate_recommendations(SUMMARY, use_cache=False), repeat
+    )
+
+    # End to end through the stub backend
+    stages["end_to_end"], result = timed(
+        lambda: rag.run_rag_report(QUERY, activities, k=16), repeat
+    )
+    if not result.get("success"):
+        raise RuntimeError(result.get("error"))
+
+    return {
+        "activities": n,
+        "indexed": len(texts),
+        "seconds": {stage: round(value, 6) for stage, value in stages.items()},
+        "activities_per_sec": {
+            "data_prep": round(n / stages["data_prep"], 1),
+            embedding_stage: round(len(texts) / stages[embedding_stage], 1),
+            "end_to_end": round(n / stages["end_to_end"], 1),
+        },
+    }
+
+
+if __name__ == "__main__":
+    # Everything must run offline
+    model_backends.DEFAULT_BACKEND = "stub"
+
+    args = sys.argv[1:]
+    sizes = DEFAULT_SIZES
+    repeat = 3
+    if "--sizes" in args:
+        sizes = [int(s) for s in args[args.index("--sizes") + 1].split(",")]
+    if "--repeat" in args:
+        repeat = int(args[args.index("--repeat") + 1])
+
+    embedder = load_local_embedding_model(rag.EMBEDDING_MODEL)
+
+    results = []
+    for n in sizes:
+        print(f"Benchmarking {n} activities...", file=sys.stderr)
+        results.append(benchmark_size(n, repeat, embedder))
+
+    print(
+        json.dumps(
+            {
+                "backend": "stub",
+                "embedding_model": rag.EMBEDDING_MODEL if embedder else "stub",
+                "repeat": repeat,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Context packer for RAG prompts
+Collapses near-duplicate retrieved logs into summarized entries (count and
+time range) and keeps the packed context inside a prompt-token budget.
+Logs are compared without their volatile fields (timestamps, hashes), which
+differ between otherwise repeated events.
+"""
+
+from ml_common import lazy_import
+
+np = lazy_import("numpy")
+
+# Fields that cost prompt tokens without helping the analysis
+LOW_VALUE_FIELDS = ("blockchainHash",)
+
+# Fields that differ between repeats of the same event, ignored when clustering
+VOLATILE_FIELDS = ("timestamp", "first_seen", "last_seen")
+
+# Field order in packed entries (other fields follow in record order)
+FIELD_ORDER = ("type", "service", "location", "region", "status", "riskLevel")
+
+# Logs with cosine similarity at or above this are merged into one entry
+SIMILARITY_THRESHOLD = 0.92
+
+# Default token budget for the packed context
+DEFAULT_TOKEN_BUDGET = 384
+
+# Maximum distinct values listed for a field that varies inside a cluster
+MAX_VARIANTS = 3
+
+
+def cluster_logs(embeddings, threshold=SIMILARITY_THRESHOLD):
+    """
+    Greedy clustering in retrieval order: each log joins the first cluster
+    whose leader is similar enough, otherwise it starts a new cluster
+    Returns: list of clusters, each a list of positions into embeddings
+    """
+    if len(embeddings) == 0:
+        return []
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.maximum(norms, 1e-12)
+
+    leaders = []
+    clusters = []
+    for i, vector in enumerate(vectors):
+        if leaders:
+            similarities = vectors[leaders] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                clusters[best].append(i)
+                continue
+        leaders.append(i)
+        clusters.append([i])
+
+    return clusters
+
+
+def cluster_text(record):
+    """Record text without volatile and low-value fields, compared for clustering"""
+    return " | ".join(
+        f"{field}: {value}"
+        for field, value in record.items()
+        if field not in VOLATILE_FIELDS and field not in LOW_VALUE_FIELDS
+    )
+
+
+def cluster_records(records, embed=None, threshold=SIMILARITY_THRESHOLD):
+    """
+    Cluster retrieved logs in retrieval order: logs with identical cluster
+    text are grouped first, then groups whose cluster text embeddings are
+    similar enough are merged (when embed is given)
+    embed: callable mapping a list of texts to embeddings
+    Returns: list of clusters, each a list of positions into records
+    """
+    groups = {}
+    for i, record in enumerate(records):
+        groups.setdefault(cluster_text(record), []).append(i)
+    texts = list(groups)
+    if embed is None or len(texts) < 2:
+        return list(groups.values())
+
+    clusters = cluster_logs(embed(texts), threshold)
+    return [[i for g in cluster for i in groups[texts[g]]] for cluster in clusters]
+
+
+def summarize_cluster(records):
+    """Render a cluster of log records as one line of prompt context"""
+    fields = []
+    for record in records:
+        for field in record:
+            if field not in fields and field not in LOW_VALUE_FIELDS:
+                fields.append(field)
+    fields.sort(key=lambda f: FIELD_ORDER.index(f) if f in FIELD_ORDER else 99)
+
+    parts = []
+    if len(records) > 1:
+        parts.append(f"count: {len(records)}")
+
+    for field in fields:
+        if field == "timestamp":
+            continue
+        values = []
+        for record in records:
+            value = record.get(field)
+            if value is not None and value not in values:
+                values.append(value)
+        if not values:
+            continue
+        shown = "/".join(str(v) for v in values[:MAX_VARIANTS])
+        if len(values) > MAX_VARIANTS:
+            shown += "/…"
+        parts.append(f"{field}: {shown}")
+
+    timestamps = sorted(
+        str(record["timestamp"]) for record in records if record.get("timestamp")
+    )
+    if timestamps:
+        if timestamps[0] == timestamps[-1]:
+            parts.append(f"timestamp: {timestamps[0]}")
+        else:
+            parts.append(f"time range: {timestamps[0]} → {timestamps[-1]}")
+
+    return " | ".join(parts)
+
+
+def pack_context(
+    records,
+    embed,
+    count_tokens,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    threshold=SIMILARITY_THRESHOLD,
+):
+    """
+    Pack retrieved logs into prompt context
+    records: retrieved log dicts, most relevant first
+    embed: callable mapping a list of texts to embeddings (None = exact only)
+    count_tokens: callable returning the prompt-token count of a text
+    Returns: (context_str, number of logs represented in the context)
+    """
+    lines = []
+    used_tokens = 0
+    covered = 0
+
+    for cluster in cluster_records(records, embed, threshold):
+        line = "- " + summarize_cluster([records[i] for i in cluster])
+        cost = count_tokens(line + "\n")
+        if used_tokens + cost > token_budget:
+            # Skip entries that overflow, a later (smaller) one may still fit
+            continue
+        lines.append(line)
+        used_tokens += cost
+        covered += len(cluster)
+
+    return "\n".join(lines), covered
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+CPU-quantized embedding mode for RAG retrieval
+Quantizes the embedding model's linear layers to int8 and picks a bucketed
+max sequence length for the short "key: value | ..." knowledge texts.
+
+Run as a script to compare the int8 model against full precision:
+    python3 embedding_quantization.py [activities.json] [--sample N] [--k K]
+activities.json holds a list of activities (same format as the RAG input);
+without it a sample is built from the ShadowID dataset CSV.
+"""
+
+import os
+import sys
+import json
+import time
+
+from ml_common import SCRIPT_DIR, lazy_import
+
+np = lazy_import("numpy")
+
+# Max sequence length buckets, the smallest one covering the texts is used
+SEQ_LENGTH_BUCKETS = (32, 64, 96, 128)
+
+# Percentile of text token lengths the chosen bucket must cover
+SEQ_LENGTH_PERCENTILE = 95
+
+DATASET_PATH = os.path.join(
+    SCRIPT_DIR,
+    "../../DeepLearning_Classification/Dataset/shadow_id_v2_English_Dataset.csv",
+)
+
+
+def quantize_embedding_model(model):
+    """Replace the model's nn.Linear layers with dynamically int8-quantized ones"""
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def pick_max_seq_length(model, texts, percentile=SEQ_LENGTH_PERCENTILE):
+    """Smallest length bucket covering `percentile` of the texts' token lengths"""
+    if not texts:
+        return SEQ_LENGTH_BUCKETS[0]
+
+    lengths = [
+        len(ids) for ids in model.tokenizer(list(texts), truncation=False)["input_ids"]
+    ]
+    target = np.percentile(lengths, percentile)
+    for bucket in SEQ_LENGTH_BUCKETS:
+        if bucket >= target:
+            return bucket
+    return SEQ_LENGTH_BUCKETS[-1]
+
+
+def top_k_neighbors(embeddings, queries, k):
+    """Indices of the k most cosine-similar embeddings for each query"""
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    similarities = queries @ embeddings.T
+    return np.argsort(-similarities, axis=1)[:, :k]
+
+
+def timed_encode(model, texts):
+    """Encode texts, returning (embeddings, seconds)"""
+    start = time.perf_counter()
+    embeddings = model.encode(texts, show_progress_bar=False, batch_size=64)
+    return np.asarray(embeddings, dtype=np.float32), time.perf_counter() - start
+
+
+def sample_activities_from_dataset(n):
+    """Build activity-like records from the ShadowID dataset CSV"""
+    import pandas as pd
+
+    df = pd.read_csv(DATASET_PATH, encoding="utf-8-sig")
+    df = df.sample(n=min(n, len(df)), random_state=42)
+    return [
+        {
+            "type": "scan",
+            "location": row["Location"],
+            "region": row["Location"],
+            "status": "rejected" if row["State"] == "Suspicious" else "verified",
+            "timestamp": row["UsageTime"],
+            "riskLevel": row["RiskLabel"],
+        }
+        for _, row in df.iterrows()
+    ]
+
+
+# Report queries sent by the dashboard, used as retrieval queries
+REPORT_QUERIES = (
+    "حلل لي الأنشطة الأمنية وأعطني تقرير شامل",
+    "حلل لي الأنشطة الأمنية المشبوهة وأعطني توصيات عاجلة",
+    "حلل لي الهويات ذات مستوى High Risk وأعطني توصيات عاجلة",
+)
+
+
+def neighbor_agreement(full_top, int8_top, k):
+    """Top-k overlap and top-1 agreement between two neighbor lists"""
+    overlaps = [
+        len(set(a) & set(b)) / k for a, b in zip(full_top.tolist(), int8_top.tolist())
+    ]
+    return {
+        "queries": len(overlaps),
+        "top_k_overlap_mean": float(np.mean(overlaps)),
+        "top_k_overlap_min": float(np.min(overlaps)),
+        "top1_agreement": float(np.mean(full_top[:, 0] == int8_top[:, 0])),
+    }
+
+
+def evaluate(activities, k=4, n_queries=100):
+    """
+    Compare int8 and full-precision embeddings on the same activities
+    Queries are the report queries plus held-out activities that are not
+    indexed, so a query never retrieves itself
+    Returns top-k retrieval overlap and per-core encoding throughput
+    """
+    import random
+
+    import pandas as pd
+    import torch
+    from sentence_transformers import SentenceTransformer
+    import generate_rag_report
+
+    # Hold out up to a fifth of the activities as queries
+    activities = list(activities)
+    random.Random(42).shuffle(activities)
+    n_queries = min(n_queries, len(activities) // 5)
+    held_out, indexed = activities[:n_queries], activities[n_queries:]
+
+    texts = generate_rag_report.build_knowledge_texts(pd.DataFrame(indexed)).tolist()
+    indexed_texts = set(texts)
+    held_out_queries = []
+    if held_out:
+        held_out_queries = [
+            text
+            for text in generate_rag_report.build_knowledge_texts(
+                pd.DataFrame(held_out)
+            ).tolist()
+            if text not in indexed_texts
+        ]
+
+    full_model = SentenceTransformer(generate_rag_report.EMBEDDING_MODEL, device="cpu")
+    int8_model = quantize_embedding_model(
+        SentenceTransformer(generate_rag_report.EMBEDDING_MODEL, device="cpu")
+    )
+    int8_model.max_seq_length = pick_max_seq_length(int8_model, texts)
+
+    # Warm up both models so timings exclude one-off initialization
+    full_model.encode(texts[:8], show_progress_bar=False)
+    int8_model.encode(texts[:8], show_progress_bar=False)
+
+    full_embeddings, full_seconds = timed_encode(full_model, texts)
+    int8_embeddings, int8_seconds = timed_encode(int8_model, texts)
+
+    k = min(k, len(texts))
+    results = {}
+    for name, queries in (
+        ("report_queries", list(REPORT_QUERIES)),
+        ("held_out_queries", held_out_queries),
+    ):
+        if not queries:
+            continue
+        full_top = top_k_neighbors(
+            full_embeddings, timed_encode(full_model, queries)[0], k
+        )
+        int8_top = top_k_neighbors(
+            int8_embeddings, timed_encode(int8_model, queries)[0], k
+        )
+        results[name] = neighbor_agreement(full_top, int8_top, k)
+
+    cores = torch.get_num_threads()
+    return {
+        "activities": len(texts),
+        "k": k,
+        "max_seq_length": int8_model.max_seq_length,
+        **results,
+        "threads": cores,
+        "full_texts_per_sec_per_core": len(texts) / full_seconds / cores,
+        "int8_texts_per_sec_per_core": len(texts) / int8_seconds / cores,
+        "speedup": full_seconds / int8_seconds,
+    }
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sample = 1000
+    k = 4
+    if "--sample" in args:
+        sample = int(args.pop(args.index("--sample") + 1))
+        args.remove("--sample")
+    if "--k" in args:
+        k = int(args.pop(args.index("--k") + 1))
+        args.remove("--k")
+
+    if args:
+        with open(args[0], "r", encoding="utf-8") as f:
+            activities = json.load(f)[:sample]
+    else:
+        activities = sample_activities_from_dataset(sample)
+
+    print(f"Evaluating on {len(activities)} activities...", file=sys.stderr)
+    print(json.dumps(evaluate(activities, k=k), indent=2))
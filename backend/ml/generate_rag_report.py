@@ -2,87 +2,82 @@
 """
 RAG-based Security Report Generator for ShadowID
 Converts activity logs into intelligent Arabic security reports using RAG
+
+Usage:
+    echo '{"query": "...", "activities": [...], "k": 4}' | python3 generate_rag_report.py
+Optional input keys: "stream", "chunk", "queries", "summary", "tier",
+"quantizedEmbeddings" (see RAG_README.md)
 """
 
+import os
 import sys
+import re
 import json
-import pandas as pd
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.neighbors import NearestNeighbors
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
 import warnings
 
+import model_backends
+import generate_recommendations as recommendations_prompt
+from context_packer import DEFAULT_TOKEN_BUDGET, pack_context
+import embedding_quantization
+from activity_rollups import rollup_to_text, update_rollups
+from ml_common import handle_help, lazy_import
+
+# Heavy libraries are imported on first use
+pd = lazy_import("pandas")
+
 warnings.filterwarnings("ignore")
 
 # Model paths
 EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 LLM_MODEL_ID = "Qwen/Qwen2.5-1.5B-Instruct"
 
+# Opt-in int8 dynamic quantization of the embedding model (CPU)
+EMBEDDING_QUANTIZED = os.environ.get("SHADOWID_EMBEDDING_QUANTIZED", "") == "1"
+
+# Generation settings for the security report
+GENERATION_KWARGS = {
+    "max_new_tokens": 512,
+    "temperature": 0.7,
+    "repetition_penalty": 1.1,
+}
+
+# Prompt-token budget for the packed retrieved logs
+CONTEXT_TOKEN_BUDGET = DEFAULT_TOKEN_BUDGET
+
 # Global variables (loaded once)
 embedding_model = None
-llm_pipe = None
-tokenizer = None
+llm_backend = None
 knn_index = None
 df_rag = None
 
 
 def load_models():
     """Load embedding model and LLM once"""
-    global embedding_model, llm_pipe, tokenizer
+    global embedding_model, llm_backend
 
     if embedding_model is None:
         print("Loading embedding model...", file=sys.stderr)
-        embedding_model = SentenceTransformer(EMBEDDING_MODEL)
-        print("✅ Embedding model loaded", file=sys.stderr)
-
-    if llm_pipe is None:
-        print("Loading LLM...", file=sys.stderr)
-        tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL_ID)
-        # Try to use device_map if accelerate is available, otherwise use CPU
-        try:
-            import accelerate
-
-            model = AutoModelForCausalLM.from_pretrained(
-                LLM_MODEL_ID, dtype="auto", device_map="auto"
-            )
-        except ImportError:
-            # Fallback to CPU if accelerate is not available
-            model = AutoModelForCausalLM.from_pretrained(LLM_MODEL_ID, dtype="auto")
-        llm_pipe = pipeline(
-            "text-generation",
-            model=model,
-            tokenizer=tokenizer,
-            max_new_tokens=512,
-            temperature=0.7,
-            repetition_penalty=1.1,
+        embedding_model = model_backends.load_embedding_model(
+            EMBEDDING_MODEL, quantized=EMBEDDING_QUANTIZED
         )
-        print("✅ LLM loaded", file=sys.stderr)
-
+        if EMBEDDING_QUANTIZED:
+            print("✅ Embedding model loaded (int8)", file=sys.stderr)
+        else:
+            print("✅ Embedding model loaded", file=sys.stderr)
 
-def prepare_data(activities_data):
-    """
-    Convert activities JSON to DataFrame and prepare for RAG
-    activities_data: List of activity objects from database
-    """
-    global df_rag, knn_index, embedding_model
+    if llm_backend is None:
+        llm_backend = model_backends.get_generation_backend(LLM_MODEL_ID)
 
-    if not activities_data:
-        return None
 
-    # Convert to DataFrame
-    df = pd.DataFrame(activities_data)
+def count_activities(df):
+    """Number of activities behind the prepared rows (rollups count events)"""
+    if "events" in df.columns:
+        return int(df["events"].sum())
+    return len(df)
 
-    # Filter for Medium/High risk if RiskLabel exists
-    if "riskLevel" in df.columns:
-        mask = df["riskLevel"].astype(str).str.lower().isin(["medium", "high"])
-        df_rag = df[mask].copy()
-        if df_rag.empty:
-            df_rag = df.copy()
-    else:
-        df_rag = df.copy()
 
-    # Build knowledge_text for each event
+def build_knowledge_texts(df):
+    """Render each activity row as a "key: value | ..." knowledge text"""
     columns_for_text = [
         "type",
         "service",
@@ -94,7 +89,7 @@ def prepare_data(activities_data):
         "blockchainHash",
     ]
 
-    available_cols = [c for c in columns_for_text if c in df_rag.columns]
+    available_cols = [c for c in columns_for_text if c in df.columns]
 
     def row_to_text(row):
         parts = []
@@ -105,14 +100,59 @@ def prepare_data(activities_data):
             parts.append(f"{col}: {val}")
         return " | ".join(parts)
 
-    df_rag["knowledge_text"] = df_rag.apply(row_to_text, axis=1)
+    return df.apply(row_to_text, axis=1)
+
+
+def prepare_data(activities_data, tier="raw"):
+    """
+    Convert activities JSON to DataFrame and prepare for RAG
+    activities_data: List of activity objects from database
+    tier: "raw" indexes individual activities,
+          "rollup" indexes time-bucketed aggregates (see activity_rollups.py)
+    """
+    global df_rag, knn_index, embedding_model
+
+    if not activities_data:
+        return None
+
+    # Convert to DataFrame
+    if tier == "rollup":
+        df = pd.DataFrame(update_rollups(activities_data))
+    else:
+        df = pd.DataFrame(activities_data)
+
+    # e.g. no activity had a parseable timestamp, so there are no rollups
+    if df.empty:
+        return None
+
+    # Filter for Medium/High risk if RiskLabel exists
+    if "riskLevel" in df.columns:
+        mask = df["riskLevel"].astype(str).str.lower().isin(["medium", "high"])
+        df_rag = df[mask].copy()
+        if df_rag.empty:
+            df_rag = df.copy()
+    else:
+        df_rag = df.copy()
+
+    # Build knowledge_text for each event (or rollup)
+    if tier == "rollup":
+        df_rag["knowledge_text"] = df_rag.apply(rollup_to_text, axis=1)
+    else:
+        df_rag["knowledge_text"] = build_knowledge_texts(df_rag)
 
     # Create embeddings
     load_models()
     texts = df_rag["knowledge_text"].tolist()
+    if EMBEDDING_QUANTIZED and hasattr(embedding_model, "tokenizer"):
+        # Shorter padded batches for our short knowledge texts
+        embedding_model.max_seq_length = embedding_quantization.pick_max_seq_length(
+            embedding_model, texts
+        )
     embeddings = embedding_model.encode(texts, show_progress_bar=False)
 
     # Build KNN index
+    from sklearn.neighbors import NearestNeighbors
+
     knn_index = NearestNeighbors(n_neighbors=min(4, len(df_rag)), metric="cosine")
     knn_index.fit(embeddings)
 
@@ -139,23 +179,54 @@ def search_relevant_logs(query, k=4):
     for idx, dist in zip(indices[0], distances[0]):
         similarity = 1 - dist  # Convert distance to similarity
         log_text = df_rag.iloc[idx]["knowledge_text"]
-        retrieved_logs.append({"text": log_text, "similarity": float(similarity)})
+        retrieved_logs.append(
+            {"text": log_text, "similarity": float(similarity), "index": int(idx)}
+        )
 
     return retrieved_logs
 
 
-def generate_response(user_query, retrieved_logs):
-    """Generate Arabic security report using LLM"""
-    global llm_pipe, tokenizer
-
-    if llm_pipe is None:
+def count_tokens(text):
+    """Prompt-token count of a text, measured with the LLM tokenizer"""
+    if llm_backend is None:
         load_models()
+    return llm_backend.count_tokens(text)
 
-    # Prepare context
-    context_str = "\n".join([f"- {log['text']}" for log in retrieved_logs])
 
-    # Prepare messages
-    messages = [
+def build_context(retrieved_logs, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Pack retrieved logs into prompt context: near-duplicates are collapsed
+    into one entry with a count and time range, low-value fields are dropped,
+    and the result stays within token_budget
+    Returns: (context_str, number of retrieved logs represented in it)
+    """
+    records = []
+    for log in retrieved_logs:
+        row = df_rag.iloc[log["index"]]
+        records.append(
+            {
+                col: val
+                for col, val in row.items()
+                if col != "knowledge_text" and not pd.isna(val)
+            }
+        )
+
+    def embed(texts):
+        return embedding_model.encode(texts, show_progress_bar=False)
+
+    context_str, covered = pack_context(
+        records, embed, count_tokens, token_budget=token_budget
+    )
+    print(
+        f"Packed {covered}/{len(retrieved_logs)} retrieved logs into the context",
+        file=sys.stderr,
+    )
+    return context_str, covered
+
+
+def build_messages(user_query, context_str):
+    """Build the chat messages for the security report prompt"""
+    return [
         {
             "role": "system",
             "content": (
@@ -170,26 +241,63 @@ def generate_response(user_query, retrieved_logs):
         },
     ]
 
-    # Generate
-    prompt = tokenizer.apply_chat_template(
-        messages, tokenize=False, add_generation_prompt=True
-    )
-    outputs = llm_pipe(prompt)
 
-    # Extract response
-    full_response = outputs[0]["generated_text"]
-    response_only = full_response.split("<|im_start|>assistant")[-1].strip()
+def generate_response(user_query, context_str):
+    """Generate Arabic security report using LLM"""
+    if llm_backend is None:
+        load_models()
+
+    messages = build_messages(user_query, context_str)
+
+    # Generate (the system prompt prefix is served from the KV-cache)
+    return llm_backend.generate(messages, **GENERATION_KWARGS)
+
+
+# Sentence boundaries used when streaming in "sentence" mode (Arabic and Latin),
+# a dot after a digit is list numbering ("1.") rather than a sentence end
+SENTENCE_END = re.compile(r"(?<=\D[.!?؟؛])|(?<=\n)")
 
-    return response_only
 
+def stream_response(user_query, context_str, chunk="token"):
+    """
+    Generate Arabic security report using LLM, yielding text as it is produced
+    chunk: "token" yields decoded pieces as they arrive,
+           "sentence" buffers them into whole sentences/lines
+    """
+    if llm_backend is None:
+        load_models()
+
+    messages = build_messages(user_query, context_str)
+
+    buffer = ""
+    for text in llm_backend.stream(messages, **GENERATION_KWARGS):
+        if chunk != "sentence":
+            yield text
+            continue
+
+        buffer += text
+        parts = SENTENCE_END.split(buffer)
+        # Last part is an unfinished sentence, keep it for the next piece
+        pending = ""
+        for part in parts[:-1]:
+            # Whitespace-only parts (e.g. "\n") are glued to the next sentence
+            pending += part
+            if pending.strip():
+                yield pending
+                pending = ""
+        buffer = pending + parts[-1]
+
+    if buffer.strip():
+        yield buffer
 
-def run_rag_report(query, activities_data, k=4):
+
+def run_rag_report(query, activities_data, k=4, tier="raw"):
     """
     Main RAG function: Prepare data, search, and generate report
     """
     try:
         # Prepare data
-        df = prepare_data(activities_data)
+        df = prepare_data(activities_data, tier=tier)
         if df is None or len(df) == 0:
             return {"success": False, "error": "No activity data available for RAG"}
 
@@ -199,29 +307,173 @@ def run_rag_report(query, activities_data, k=4):
         if not retrieved_logs:
             return {"success": False, "error": "No relevant logs found"}
 
-        # Generate report
-        report = generate_response(query, retrieved_logs)
+        # Pack context and generate report
+        context_str, covered = build_context(retrieved_logs)
+        report = generate_response(query, context_str)
 
         return {
             "success": True,
             "report": report,
-            "retrieved_count": len(retrieved_logs),
-            "total_activities": len(df),
+            "retrieved_count": covered,
+            "total_activities": count_activities(df),
         }
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+def run_rag_report_stream(query, activities_data, k=4, chunk="token", tier="raw"):
+    """
+    Streaming variant of run_rag_report
+    Yields {"event": "chunk", "text": ...} while the report is generated,
+    then a final {"event": "done", ...} (or {"event": "error", ...}) event
+    """
+    try:
+        # Prepare data
+        df = prepare_data(activities_data, tier=tier)
+        if df is None or len(df) == 0:
+            yield {
+                "event": "error",
+                "success": False,
+                "error": "No activity data available for RAG",
+            }
+            return
+
+        # Search relevant logs
+        retrieved_logs = search_relevant_logs(query, k=k)
+
+        if not retrieved_logs:
+            yield {
+                "event": "error",
+                "success": False,
+                "error": "No relevant logs found",
+            }
+            return
+
+        # Pack context and generate report, forwarding chunks as they arrive
+        context_str, covered = build_context(retrieved_logs)
+        pieces = []
+        for text in stream_response(query, context_str, chunk=chunk):
+            pieces.append(text)
+            yield {"event": "chunk", "text": text}
+
+        yield {
+            "event": "done",
+            "success": True,
+            "report": "".join(pieces).strip(),
+            "retrieved_count": covered,
+            "total_activities": count_activities(df),
+        }
+    except Exception as e:
+        yield {"event": "error", "success": False, "error": str(e)}
+
+
+def run_rag_report_batch(
+    queries, activities_data, k=4, summary=None, tier="raw", use_cache=True
+):
+    """
+    Generate several RAG reports (and optionally recommendations) together
+    Data is prepared once, each query retrieves its own logs, and all prompts
+    are generated as one batch with per-sequence stopping
+    queries: list of report queries
+    summary: optional summary statistics for LLM recommendations
+    use_cache: serve recommendations from the recommendation cache when possible
+    """
+    try:
+        # Prepare data
+        df = prepare_data(activities_data, tier=tier)
+        if df is None or len(df) == 0:
+            return {"success": False, "error": "No activity data available for RAG"}
+
+        messages_list = []
+        limits = []
+        retrieved_counts = []
+        for query in queries:
+            retrieved_logs = search_relevant_logs(query, k=k)
+            if not retrieved_logs:
+                return {"success": False, "error": f"No relevant logs found: {query}"}
+            context_str, covered = build_context(retrieved_logs)
+            messages_list.append(build_messages(query, context_str))
+            limits.append(GENERATION_KWARGS["max_new_tokens"])
+            retrieved_counts.append(covered)
+
+        # Cached recommendations keep their prompt out of the batch
+        recommendations = None
+        if summary and use_cache:
+            recommendations = recommendations_prompt.cached_recommendations(summary)
+        recommendations_in_batch = bool(summary) and recommendations is None
+        if recommendations_in_batch:
+            messages_list.append(recommendations_prompt.build_messages(summary))
+            limits.append(recommendations_prompt.GENERATION_KWARGS["max_new_tokens"])
+
+        if llm_backend is None:
+            load_models()
+
+        generation_kwargs = {
+            key: value
+            for key, value in GENERATION_KWARGS.items()
+            if key != "max_new_tokens"
+        }
+        outputs = llm_backend.generate_batch(
+            messages_list,
+            max_new_tokens=limits,
+            **generation_kwargs,
+        )
+
+        result = {
+            "success": True,
+            "reports": [
+                {"query": query, "report": report, "retrieved_count": count}
+                for query, report, count in zip(queries, outputs, retrieved_counts)
+            ],
+            "total_activities": count_activities(df),
+        }
+        if recommendations_in_batch:
+            recommendations = recommendations_prompt.parse_recommendations(outputs[-1])
+            if use_cache:
+                recommendations_prompt.store_recommendations(summary, recommendations)
+        if summary:
+            result["recommendations"] = recommendations
+        return result
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
 if __name__ == "__main__":
+    handle_help(__doc__)
+
     # Read input from stdin
     input_data = json.loads(sys.stdin.read())
 
     query = input_data.get("query", "حلل لي الأنشطة الأمنية وأعطني تقرير شامل")
     activities = input_data.get("activities", [])
     k = input_data.get("k", 4)
+    tier = input_data.get("tier", "raw")
+    EMBEDDING_QUANTIZED = input_data.get("quantizedEmbeddings", EMBEDDING_QUANTIZED)
+
+    if "queries" in input_data:
+        # Batch mode: all reports (and recommendations) in one generation
+        result = run_rag_report_batch(
+            input_data["queries"],
+            activities,
+            k,
+            summary=input_data.get("summary"),
+            tier=tier,
+            use_cache=input_data.get("useCache", True),
+        )
+        print(json.dumps(result, ensure_ascii=False))
+        sys.exit(0)
+
+    if input_data.get("stream", False):
+        # Newline-delimited JSON events, flushed as soon as they are ready
+        chunk = input_data.get("chunk", "token")
+        for event in run_rag_report_stream(
+            query, activities, k, chunk=chunk, tier=tier
+        ):
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+        sys.exit(0)
 
     # Run RAG
-    result = run_rag_report(query, activities, k)
+    result = run_rag_report(query, activities, k, tier=tier)
 
     # Output result
     print(json.dumps(result, ensure_ascii=False))
@@ -2,58 +2,52 @@
 """
 LLM-based Recommendations Generator for ShadowID
 Generates natural language recommendations based on report statistics
+
+Usage:
+    echo '{"summary": {...}, "useCache": true}' | python3 generate_recommendations.py
 """
 
 import sys
+import re
 import json
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+import hashlib
 import warnings
 
+import model_backends
+from recommendation_cache import RecommendationCache, bucket_summary, cache_key
+from ml_common import handle_help
+
 warnings.filterwarnings("ignore")
 
 # Model path
 LLM_MODEL_ID = "Qwen/Qwen2.5-1.5B-Instruct"
 
+# Generation settings for recommendations
+GENERATION_KWARGS = {
+    "max_new_tokens": 256,
+    "temperature": 0.7,
+    "repetition_penalty": 1.1,
+}
+
+# Returned when nothing usable could be parsed (never cached)
+FALLBACK_RECOMMENDATION = "يرجى مراجعة الإحصائيات والتحقق من حالة النظام"
+
 # Global variables (loaded once)
-llm_pipe = None
-tokenizer = None
+llm_backend = None
+recommendation_cache = RecommendationCache()
 
 
 def load_models():
     """Load LLM once"""
-    global llm_pipe, tokenizer
+    global llm_backend
 
-    if llm_pipe is None:
+    if llm_backend is None:
         print("Loading LLM for recommendations...", file=sys.stderr)
-        tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL_ID)
-        # Try to use device_map if accelerate is available, otherwise use CPU
-        try:
-            import accelerate
-
-            model = AutoModelForCausalLM.from_pretrained(
-                LLM_MODEL_ID, dtype="auto", device_map="auto"
-            )
-        except ImportError:
-            # Fallback to CPU if accelerate is not available
-            model = AutoModelForCausalLM.from_pretrained(LLM_MODEL_ID, dtype="auto")
-        llm_pipe = pipeline(
-            "text-generation",
-            model=model,
-            tokenizer=tokenizer,
-            max_new_tokens=256,
-            temperature=0.7,
-            repetition_penalty=1.1,
-        )
-        print("✅ LLM loaded", file=sys.stderr)
-
+        llm_backend = model_backends.get_generation_backend(LLM_MODEL_ID)
 
-def generate_recommendations(summary_data):
-    """Generate natural language recommendations using LLM"""
-    global llm_pipe, tokenizer
-
-    if llm_pipe is None:
-        load_models()
 
+def build_messages(summary_data):
+    """Build the chat messages for the recommendations prompt"""
     # Prepare context from summary
     context = f"""
 إحصائيات النظام:
@@ -67,7 +61,7 @@ def generate_recommendations(summary_data):
 """
 
     # Prepare messages with more specific instructions
-    messages = [
+    return [
         {
             "role": "system",
             "content": (
@@ -97,34 +91,72 @@ def generate_recommendations(summary_data):
         },
     ]
 
-    # Generate
-    prompt = tokenizer.apply_chat_template(
-        messages, tokenize=False, add_generation_prompt=True
+
+def prompt_fingerprint():
+    """Hash of the rendered prompt template and generation settings"""
+    rendered = json.dumps(
+        {"messages": build_messages(bucket_summary({})), "kwargs": GENERATION_KWARGS},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(rendered.encode("utf-8")).hexdigest()[:12]
+
+
+def cache_namespace():
+    """Outputs of different backends/models/prompts never share cache entries"""
+    return f"{model_backends.DEFAULT_BACKEND}:{LLM_MODEL_ID}:{prompt_fingerprint()}"
+
+
+def cached_recommendations(summary_data):
+    """Cached recommendations for a summary, or None"""
+    return recommendation_cache.get(cache_key(summary_data, cache_namespace()))
+
+
+def store_recommendations(summary_data, recommendations):
+    """Cache parsed recommendations (the generic fallback is never cached)"""
+    if recommendations and recommendations != [FALLBACK_RECOMMENDATION]:
+        recommendation_cache.put(
+            cache_key(summary_data, cache_namespace()), recommendations
+        )
+
+
+def generate_recommendations(summary_data, use_cache=True):
+    """
+    Generate natural language recommendations using LLM
+    With use_cache, summaries that bucket to a recently seen one return the
+    cached recommendations without running the model
+    """
+    if not use_cache:
+        return _generate_recommendations(summary_data)
+
+    def compute():
+        recommendations = _generate_recommendations(summary_data)
+        # Don't cache the generic fallback, retry generation next time
+        if recommendations == [FALLBACK_RECOMMENDATION]:
+            return None
+        return recommendations
+
+    recommendations = recommendation_cache.get_or_compute(
+        summary_data, compute, namespace=cache_namespace()
     )
-    outputs = llm_pipe(prompt)
-
-    # Extract response
-    full_response = outputs[0]["generated_text"]
-
-    # Try multiple ways to extract the assistant response
-    if "<|im_start|>assistant" in full_response:
-        response_only = full_response.split("<|im_start|>assistant")[-1].strip()
-    elif "assistant" in full_response.lower():
-        # Try to find assistant response after user message
-        parts = full_response.split("user")
-        if len(parts) > 1:
-            response_only = parts[-1].strip()
-        else:
-            response_only = full_response.strip()
-    else:
-        # If no clear separator, use the full response but remove the prompt
-        # Remove the original prompt from the response
-        prompt_length = len(prompt)
-        if len(full_response) > prompt_length:
-            response_only = full_response[prompt_length:].strip()
-        else:
-            response_only = full_response.strip()
+    return recommendations or [FALLBACK_RECOMMENDATION]
+
+
+def _generate_recommendations(summary_data):
+    """Run the LLM for a summary and parse its recommendations"""
+    if llm_backend is None:
+        load_models()
 
+    messages = build_messages(summary_data)
+
+    # Generate (the system prompt prefix is served from the KV-cache)
+    response_only = llm_backend.generate(messages, **GENERATION_KWARGS)
+
+    return parse_recommendations(response_only)
+
+
+def parse_recommendations(response_only):
+    """Turn the raw LLM reply into a list of at most 5 recommendations"""
     # Clean up any remaining tokens
     response_only = (
         response_only.replace("<|im_end|>", "").replace("<|endoftext|>", "").strip()
@@ -141,8 +173,6 @@ def generate_recommendations(summary_data):
         if not line:
             continue
         # Remove numbering and bullet points (more comprehensive)
-        import re
-
         # Remove Arabic and English numbering patterns
         line = re.sub(
             r"^[\d\u0660-\u0669]+[\.\)]\s*", "", line
@@ -172,8 +202,6 @@ def generate_recommendations(summary_data):
     # If still no recommendations, use the full response but clean it
     if not recommendations:
         # Try to extract meaningful sentences
-        import re
-
         sentences = re.split(r"[.!?]\s+", response_only)
         for sentence in sentences:
             sentence = sentence.strip()
@@ -197,12 +225,14 @@ def generate_recommendations(summary_data):
                 recommendations = [cleaned]
             else:
                 # Last resort: return a generic message
-                recommendations = ["يرجى مراجعة الإحصائيات والتحقق من حالة النظام"]
+                recommendations = [FALLBACK_RECOMMENDATION]
 
     return recommendations[:5]  # Limit to 5 recommendations
 
 
 if __name__ == "__main__":
+    handle_help(__doc__)
+
     try:
         # Read input from stdin
         print("Reading input...", file=sys.stderr)
@@ -218,7 +248,9 @@ if __name__ == "__main__":
         )
 
         # Generate recommendations
-        recommendations = generate_recommendations(summary)
+        recommendations = generate_recommendations(
+            summary, use_cache=input_data.get("useCache", True)
+        )
 
         print(f"Generated {len(recommendations)} recommendations", file=sys.stderr)
         for i, rec in enumerate(recommendations, 1):
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Shared LLM generation helpers for ShadowID
+Keeps the attention KV-cache of the fixed Arabic system prompts on disk so
+each request (a new process) only prefills its own user content, and
+generates several prompts as one batch
+"""
+
+import os
+import sys
+import hashlib
+from threading import Thread
+
+import torch
+import transformers
+from transformers import (
+    DynamicCache,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+)
+
+from ml_common import SCRIPT_DIR
+
+# Prefilled system prompt prefixes, one file per prefix
+PREFIX_CACHE_DIR = os.path.join(SCRIPT_DIR, ".cache", "prefix_kv")
+
+# Maximum number of system prompt prefixes kept in memory and on disk
+MAX_CACHED_PREFIXES = 8
+
+# Cached prefixes: key -> (prefix_ids, [(key, value) per layer])
+_prefix_cache = {}
+
+
+def _prefix_key(model, prefix_text):
+    """
+    Cache key, changes whenever the model, its dtype, the prompt text or the
+    torch/transformers versions (KV layout) change
+    """
+    identity = "|".join(
+        [
+            getattr(model.config, "_name_or_path", ""),
+            str(model.dtype),
+            transformers.__version__,
+            torch.__version__,
+            prefix_text,
+        ]
+    )
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def _prefix_path(key):
+    return os.path.join(PREFIX_CACHE_DIR, f"{key}.pt")
+
+
+def _load_prefix(key):
+    """Read a saved prefix from disk, or None if missing/unusable"""
+    path = _prefix_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        data = torch.load(path, map_location="cpu", weights_only=True)
+        layers = [
+            (k.to(device), v.to(device))
+            for k, v, device in zip(data["keys"], data["values"], data["devices"])
+        ]
+        return data["prefix_ids"], layers
+    except Exception as e:
+        print(f"Ignoring unusable prefix cache {path}: {e}", file=sys.stderr)
+        return None
+
+
+def _save_prefix(key, prefix_ids, layers):
+    """Write a prefix (temp file + rename) and keep only the newest files"""
+    os.makedirs(PREFIX_CACHE_DIR, exist_ok=True)
+    path = _prefix_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save(
+        {
+            "prefix_ids": prefix_ids.cpu(),
+            "keys": [k.cpu() for k, _ in layers],
+            "values": [v.cpu() for _, v in layers],
+            "devices": [str(k.device) for k, _ in layers],
+        },
+        tmp_path,
+    )
+    os.replace(tmp_path, path)
+
+    # Drop the oldest prefixes (e.g. an outdated prompt text) when full
+    saved = sorted(
+        (os.path.join(PREFIX_CACHE_DIR, name) for name in os.listdir(PREFIX_CACHE_DIR)),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    for old_path in saved[MAX_CACHED_PREFIXES:]:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+
+def _cache_layers(cache):
+    """[(key, value) per layer] of a DynamicCache"""
+    if hasattr(cache, "layers"):
+        # transformers >= 4.56 keeps one object per layer
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def _build_cache(layers):
+    """
+    Fresh DynamicCache holding the prefix tensors. generate() concatenates
+    new tokens into new tensors, so the cached ones are never modified
+    """
+    cache = DynamicCache()
+    for layer_idx, (key, value) in enumerate(layers):
+        cache.update(key, value, layer_idx)
+    return cache
+
+
+def build_prompt(tokenizer, messages):
+    """
+    Render chat messages with the model's chat template
+    Returns: (prefix_text, prompt) where prefix_text is the rendered system
+    message when the full prompt starts with it, otherwise ""
+    """
+    prompt = tokenizer.apply_chat_template(
+        messages, tokenize=False, add_generation_prompt=True
+    )
+
+    prefix_text = ""
+    if messages and messages[0].get("role") == "system":
+        prefix_text = tokenizer.apply_chat_template(messages[:1], tokenize=False)
+        if not prompt.startswith(prefix_text):
+            prefix_text = ""
+
+    return prefix_text, prompt
+
+
+def get_prefix_cache(model, tokenizer, prefix_text):
+    """
+    Return (prefix_ids, layers) for a prefix: from memory, then from disk,
+    otherwise prefilled once and saved for the next processes
+    """
+    key = _prefix_key(model, prefix_text)
+    entry = _prefix_cache.get(key)
+    if entry is not None:
+        return entry
+
+    entry = _load_prefix(key)
+    if entry is None:
+        prefix_ids = tokenizer(
+            prefix_text, return_tensors="pt", add_special_tokens=False
+        ).input_ids.to(model.device)
+        with torch.no_grad():
+            past_key_values = model(
+                input_ids=prefix_ids, past_key_values=DynamicCache(), use_cache=True
+            ).past_key_values
+        layers = _cache_layers(past_key_values)
+        entry = (prefix_ids, layers)
+        try:
+            _save_prefix(key, prefix_ids, layers)
+        except OSError as e:
+            print(f"Could not save prefix cache: {e}", file=sys.stderr)
+
+    if len(_prefix_cache) >= MAX_CACHED_PREFIXES:
+        _prefix_cache.pop(next(iter(_prefix_cache)))
+    _prefix_cache[key] = entry
+    return entry
+
+
+def clear_prefix_cache():
+    """Forget all cached system prompt prefixes (in memory and on disk)"""
+    _prefix_cache.clear()
+    if os.path.isdir(PREFIX_CACHE_DIR):
+        for name in os.listdir(PREFIX_CACHE_DIR):
+            os.remove(os.path.join(PREFIX_CACHE_DIR, name))
+
+
+def _prepare_inputs(model, tokenizer, messages, generation_kwargs):
+    """Tokenize the prompt and attach a copy of the cached prefix if it matches"""
+    prefix_text, prompt = build_prompt(tokenizer, messages)
+    inputs = tokenizer(prompt, return_tensors="pt", add_special_tokens=False).to(
+        model.device
+    )
+
+    if prefix_text:
+        prefix_ids, layers = get_prefix_cache(model, tokenizer, prefix_text)
+        prefix_len = prefix_ids.shape[1]
+        input_ids = inputs["input_ids"]
+        # Only reuse the cache when the tokens line up exactly with the prefix
+        if input_ids.shape[1] > prefix_len and torch.equal(
+            input_ids[0, :prefix_len], prefix_ids[0].to(input_ids.device)
+        ):
+            generation_kwargs["past_key_values"] = _build_cache(layers)
+
+    return inputs
+
+
+def generate(model, tokenizer, messages, **generation_kwargs):
+    """Generate a reply for chat messages, returning only the new text"""
+    inputs = _prepare_inputs(model, tokenizer, messages, generation_kwargs)
+    prompt_len = inputs["input_ids"].shape[1]
+
+    with torch.no_grad():
+        output_ids = model.generate(**inputs, **generation_kwargs)
+
+    return tokenizer.decode(
+        output_ids[0, prompt_len:], skip_special_tokens=True
+    ).strip()
+
+
+def stream(model, tokenizer, messages, **generation_kwargs):
+    """Generate a reply for chat messages, yielding text as it is decoded"""
+    inputs = _prepare_inputs(model, tokenizer, messages, generation_kwargs)
+
+    # Generation runs in a worker thread and pushes decoded text to the streamer
+    streamer = TextIteratorStreamer(
+        tokenizer, skip_prompt=True, skip_special_tokens=True
+    )
+
+    errors = []
+
+    def run():
+        try:
+            with torch.no_grad():
+                model.generate(**inputs, streamer=streamer, **generation_kwargs)
+        except Exception as e:
+            errors.append(e)
+            # Unblock the consumer loop below
+            streamer.end()
+
+    worker = Thread(target=run)
+    worker.start()
+
+    for text in streamer:
+        if text:
+            yield text
+
+    worker.join()
+    if errors:
+        raise errors[0]
+
+
+class PerSequenceMaxTokens(StoppingCriteria):
+    """Stops each sequence of a batch once it reaches its own token limit"""
+
+    def __init__(self, prompt_len, limits):
+        self.prompt_len = prompt_len
+        self.limits = limits
+
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids.shape[1] - self.prompt_len
+        return generated >= self.limits.to(input_ids.device)
+
+
+def generate_batch(
+    model, tokenizer, messages_list, max_new_tokens=512, **generation_kwargs
+):
+    """
+    Generate replies for several chat prompts in one batched forward pass
+    max_new_tokens: one limit for every prompt, or a list with one per prompt
+    Returns: list of reply texts, in the same order as messages_list
+    """
+    if not messages_list:
+        return []
+
+    if isinstance(max_new_tokens, int):
+        limits = [max_new_tokens] * len(messages_list)
+    else:
+        limits = list(max_new_tokens)
+        if len(limits) != len(messages_list):
+            raise ValueError("max_new_tokens must have one entry per prompt")
+
+    prompts = [build_prompt(tokenizer, messages)[1] for messages in messages_list]
+
+    # Decoder-only models need left padding so every prompt ends at the same column
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    try:
+        inputs = tokenizer(
+            prompts, return_tensors="pt", padding=True, add_special_tokens=False
+        ).to(model.device)
+    finally:
+        tokenizer.padding_side = padding_side
+    prompt_len = inputs["input_ids"].shape[1]
+
+    # Finished sequences (EOS or own limit) stop while the rest keep going
+    stopping_criteria = StoppingCriteriaList(
+        [PerSequenceMaxTokens(prompt_len, torch.tensor(limits))]
+    )
+    pad_token_id = tokenizer.pad_token_id
+    if pad_token_id is None:
+        pad_token_id = tokenizer.eos_token_id
+
+    with torch.no_grad():
+        output_ids = model.generate(
+            **inputs,
+            max_new_tokens=max(limits),
+            stopping_criteria=stopping_criteria,
+            pad_token_id=pad_token_id,
+            **generation_kwargs,
+        )
+
+    return [
+        tokenizer.decode(
+            row[prompt_len : prompt_len + limit], skip_special_tokens=True
+        ).strip()
+        for row, limit in zip(output_ids, limits)
+    ]
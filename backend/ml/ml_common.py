@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Lightweight shared helpers for the ShadowID ML scripts
+Imports nothing heavy: numpy, pandas, sklearn, tensorflow, transformers and
+sentence_transformers are only loaded when a code path actually uses them,
+so --help, input validation errors and empty requests return immediately.
+"""
+
+import os
+import sys
+import json
+import types
+import importlib
+
+# Get the directory where this script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(SCRIPT_DIR, "../../DeepLearning_Classification/Models")
+
+
+class LazyModule(types.ModuleType):
+    """Module placeholder that imports the real module on first attribute access"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._lazy_module = None
+
+    def _load(self):
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self.__name__)
+        return self._lazy_module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name):
+    """
+    Return module `name`, deferring the import until it is first used
+    e.g. pd = lazy_import("pandas") costs nothing until pd.DataFrame(...)
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def handle_help(doc, argv=None):
+    """Print the script docstring and exit on -h/--help (before any heavy import)"""
+    argv = sys.argv[1:] if argv is None else argv
+    if "-h" in argv or "--help" in argv:
+        print((doc or "").strip())
+        sys.exit(0)
+
+
+def read_json_input(argv=None):
+    """Read the JSON request from the first CLI argument, or from stdin"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return json.loads(argv[0])
+    return json.loads(sys.stdin.read())
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Pluggable model backends for the ShadowID report pipeline
+- "hf": Hugging Face models (Qwen LLM + sentence-transformers embeddings)
+- "stub": deterministic offline stand-ins with canned Arabic text and
+  configurable latency, for tests and benchmarks without model downloads
+Select with SHADOWID_MODEL_BACKEND (default "hf").
+"""
+
+import os
+import sys
+import abc
+import time
+import zlib
+
+from ml_common import lazy_import
+
+np = lazy_import("numpy")
+
+# Backend used when none is requested explicitly
+DEFAULT_BACKEND = os.environ.get("SHADOWID_MODEL_BACKEND", "hf")
+
+# Simulated generation latency of the stub backend (seconds per call)
+STUB_LATENCY_SECONDS = float(os.environ.get("SHADOWID_STUB_LATENCY", "0"))
+
+# Dimensions of the stub embeddings (same as paraphrase-multilingual-MiniLM)
+STUB_EMBEDDING_DIM = 384
+
+STUB_REPORT = (
+    "1. ملخص الحالة:\n"
+    "تم رصد عدد من الأنشطة المرفوضة ذات مستوى مخاطر متوسط ومرتفع خلال الفترة المحددة.\n"
+    "2. تحليل المخاطر:\n"
+    "تتركز المحاولات المشبوهة في خدمات ومناطق محددة وخلال فترات زمنية متقاربة.\n"
+    "3. التوصيات:\n"
+    "- مراجعة الأجهزة غير الموثقة المرتبطة بالهويات عالية المخاطر.\n"
+    "- تفعيل التحقق الإضافي للعمليات المرفوضة المتكررة.\n"
+    "- متابعة التنبيهات غير المحلولة بشكل يومي."
+)
+
+STUB_RECOMMENDATIONS = (
+    "1. مراجعة التنبيهات غير المحلولة وتحديد أولوياتها حسب مستوى الخطورة.\n"
+    "2. مراقبة الهويات ذات المخاطر العالية والتحقق من أجهزتها المسجلة.\n"
+    "3. تحليل أسباب العمليات المرفوضة لتحسين معدل النجاح.\n"
+    "4. تفعيل التنبيه الفوري عند رصد تنقل مستحيل أو تبديل للأجهزة."
+)
+
+# Loaded backends, one per (name, model id)
+_backends = {}
+
+
+class GenerationBackend(abc.ABC):
+    """Interface for chat-style text generation used by the report scripts"""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def generate(self, messages, **generation_kwargs):
+        """Generate a reply for chat messages, returning only the new text"""
+
+    @abc.abstractmethod
+    def stream(self, messages, **generation_kwargs):
+        """Generate a reply for chat messages, yielding text as it is produced"""
+
+    @abc.abstractmethod
+    def generate_batch(self, messages_list, max_new_tokens=512, **generation_kwargs):
+        """Generate replies for several chat prompts, in order"""
+
+    @abc.abstractmethod
+    def count_tokens(self, text):
+        """Prompt-token count of a text"""
+
+
+class HFBackend(GenerationBackend):
+    """Hugging Face causal LM, with the system prompt KV-cache and batching"""
+
+    name = "hf"
+
+    def __init__(self, model_id):
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        print("Loading LLM...", file=sys.stderr)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        # Try to use device_map if accelerate is available, otherwise use CPU
+        try:
+            import accelerate
+
+            self.model = AutoModelForCausalLM.from_pretrained(
+                model_id, dtype="auto", device_map="auto"
+            )
+        except ImportError:
+            # Fallback to CPU if accelerate is not available
+            self.model = AutoModelForCausalLM.from_pretrained(model_id, dtype="auto")
+        print("✅ LLM loaded", file=sys.stderr)
+
+    def generate(self, messages, **generation_kwargs):
+        import llm_generation
+
+        return llm_generation.generate(
+            self.model, self.tokenizer, messages, **generation_kwargs
+        )
+
+    def stream(self, messages, **generation_kwargs):
+        import llm_generation
+
+        return llm_generation.stream(
+            self.model, self.tokenizer, messages, **generation_kwargs
+        )
+
+    def generate_batch(self, messages_list, max_new_tokens=512, **generation_kwargs):
+        import llm_generation
+
+        return llm_generation.generate_batch(
+            self.model,
+            self.tokenizer,
+            messages_list,
+            max_new_tokens=max_new_tokens,
+            **generation_kwargs,
+        )
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+
+class StubBackend(GenerationBackend):
+    """Deterministic offline backend returning canned Arabic text"""
+
+    name = "stub"
+
+    def __init__(self, latency_seconds=STUB_LATENCY_SECONDS):
+        self.latency_seconds = latency_seconds
+
+    def _reply(self, messages):
+        # The RAG prompt asks for a security report, the other for recommendations
+        user_content = messages[-1]["content"] if messages else ""
+        if "التقرير" in user_content:
+            return STUB_REPORT
+        return STUB_RECOMMENDATIONS
+
+    def generate(self, messages, **generation_kwargs):
+        time.sleep(self.latency_seconds)
+        return self._reply(messages)
+
+    def stream(self, messages, **generation_kwargs):
+        # Spread the latency over the words, like a real token stream
+        words = self._reply(messages).split(" ")
+        delay = self.latency_seconds / max(len(words), 1)
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            yield word if i == 0 else " " + word
+
+    def generate_batch(self, messages_list, max_new_tokens=512, **generation_kwargs):
+        time.sleep(self.latency_seconds)
+        return [self._reply(messages) for messages in messages_list]
+
+    def count_tokens(self, text):
+        # Roughly one token per word piece of ~4 characters
+        return max(1, len(text) // 4)
+
+
+class StubEmbeddingModel:
+    """Deterministic hashed bag-of-words embeddings (SentenceTransformer-like)"""
+
+    def __init__(self, dim=STUB_EMBEDDING_DIM):
+        self.dim = dim
+        self.max_seq_length = 128
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.lower().replace("|", " ").split():
+                vectors[row, zlib.crc32(token.encode("utf-8")) % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def get_generation_backend(model_id, name=None):
+    """Return the (cached) generation backend `name` for model_id"""
+    name = name or DEFAULT_BACKEND
+    key = (name, model_id)
+    if key not in _backends:
+        if name == "hf":
+            _backends[key] = HFBackend(model_id)
+        elif name == "stub":
+            _backends[key] = StubBackend()
+        else:
+            raise ValueError(f"Unknown model backend: {name}")
+    return _backends[key]
+
+
+def load_embedding_model(model_id, name=None, quantized=False):
+    """Load the embedding model for backend `name`"""
+    name = name or DEFAULT_BACKEND
+    if name == "stub":
+        return StubEmbeddingModel()
+    if name != "hf":
+        raise ValueError(f"Unknown model backend: {name}")
+
+    from sentence_transformers import SentenceTransformer
+
+    if not quantized:
+        return SentenceTransformer(model_id)
+
+    import embedding_quantization
+
+    return embedding_quantization.quantize_embedding_model(
+        SentenceTransformer(model_id, device="cpu")
+    )
+
+
+def load_local_embedding_model(model_id):
+    """
+    Load the sentence-transformers model from the local Hugging Face cache
+    only (no downloads). Returns None when the library or model is missing
+    """
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    try:
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_id)
+    except Exception as e:
+        print(f"Embedding model not available locally: {e}", file=sys.stderr)
+        return None
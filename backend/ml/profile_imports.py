@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Import-time profile of the ShadowID ML entry points
+Imports each entry point in a fresh interpreter with `python -X importtime`
+and reports the total cold-import time and the slowest modules.
+
+Usage:
+    python3 profile_imports.py [--top 10] [--json]
+"""
+
+import sys
+import json
+import subprocess
+
+from ml_common import SCRIPT_DIR, handle_help
+
+# Script entry points served by the backend
+ENTRY_POINTS = (
+    "assess_risk",
+    "generate_rag_report",
+    "generate_recommendations",
+)
+
+
+def profile_import(module, top=10):
+    """Cold-import `module` under -X importtime, return total and slowest modules"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        timings.append((name.rstrip(), int(self_us), int(cumulative_us)))
+
+    total_us = next(
+        (cumulative for name, _, cumulative in timings if name.strip() == module),
+        sum(self_us for _, self_us, _ in timings),
+    )
+    slowest = sorted(timings, key=lambda t: t[2], reverse=True)
+    return {
+        "module": module,
+        "total_seconds": round(total_us / 1e6, 4),
+        "modules_imported": len(timings),
+        "slowest": [
+            {
+                "module": name.strip(),
+                "cumulative_seconds": round(cumulative_us / 1e6, 4),
+                "self_seconds": round(self_us / 1e6, 4),
+            }
+            for name, self_us, cumulative_us in slowest[1 : top + 1]
+        ],
+    }
+
+
+if __name__ == "__main__":
+    handle_help(__doc__)
+    args = sys.argv[1:]
+    top = int(args[args.index("--top") + 1]) if "--top" in args else 10
+
+    reports = [profile_import(module, top) for module in ENTRY_POINTS]
+
+    if "--json" in args:
+        print(json.dumps(reports, indent=2))
+        sys.exit(0)
+
+    for report in reports:
+        print(
+            f"{report['module']}: {report['total_seconds']:.3f}s "
+            f"({report['modules_imported']} modules)"
+        )
+        for entry in report["slowest"]:
+            print(
+                f"    {entry['cumulative_seconds']:8.4f}s  "
+                f"(self {entry['self_seconds']:.4f}s)  {entry['module']}"
+            )
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Persistent result cache for LLM recommendations
+Keys are built from a canonical, bucketed copy of the dashboard summary so
+small changes in the statistics reuse the previous generation
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: fall back to in-process coalescing only
+    fcntl = None
+
+from ml_common import SCRIPT_DIR
+
+CACHE_DIR = os.path.join(SCRIPT_DIR, ".cache")
+CACHE_PATH = os.path.join(CACHE_DIR, "recommendations.json")
+
+# Entries older than this are regenerated (seconds)
+CACHE_TTL_SECONDS = int(os.environ.get("SHADOWID_RECOMMENDATION_CACHE_TTL", 15 * 60))
+# Least recently used entries are evicted beyond this size
+CACHE_MAX_ENTRIES = int(os.environ.get("SHADOWID_RECOMMENDATION_CACHE_SIZE", 256))
+# Keys share this many single-flight lock files (a fixed set, never evicted)
+LOCK_SLOTS = 64
+
+# Summary fields that are percentages, bucketed to PERCENT_BUCKET points
+PERCENT_FIELDS = ("successRate", "highRiskPercentage")
+PERCENT_BUCKET = 5
+
+# Summary fields that are counts
+COUNT_FIELDS = (
+    "totalUsers",
+    "totalShadowIds",
+    "totalActivities",
+    "totalAlerts",
+    "unresolvedAlerts",
+)
+
+
+def bucket_count(value):
+    """Exact below 10, otherwise rounded to 2 significant digits"""
+    value = int(round(float(value or 0)))
+    if abs(value) < 10:
+        return value
+    digits = len(str(abs(value))) - 2
+    return int(round(value, -digits))
+
+
+def bucket_percent(value):
+    """Round a percentage to the nearest PERCENT_BUCKET points"""
+    return int(round(float(value or 0) / PERCENT_BUCKET) * PERCENT_BUCKET)
+
+
+def bucket_summary(summary_data):
+    """Canonical, bucketed copy of the summary used for the cache key"""
+    bucketed = {}
+    for field in COUNT_FIELDS:
+        bucketed[field] = bucket_count(summary_data.get(field, 0))
+    for field in PERCENT_FIELDS:
+        default = 100 if field == "successRate" else 0
+        bucketed[field] = bucket_percent(summary_data.get(field, default))
+    return bucketed
+
+
+def cache_key(summary_data, namespace=""):
+    """Stable key for a summary; namespace separates models/prompt versions"""
+    canonical = json.dumps(
+        {"namespace": namespace, "summary": bucket_summary(summary_data)},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class RecommendationCache:
+    """
+    JSON-file cache with TTL and LRU eviction, shared between processes
+    Concurrent requests for the same key are coalesced into one generation
+    """
+
+    def __init__(
+        self,
+        path=CACHE_PATH,
+        ttl_seconds=CACHE_TTL_SECONDS,
+        max_entries=CACHE_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._slot_locks = [threading.Lock() for _ in range(LOCK_SLOTS)]
+
+    # ----- storage -----
+
+    def _file_lock(self, lock_path):
+        """Open and exclusively lock a lock file (no-op without fcntl)"""
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        handle = open(lock_path, "a")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write(self, entries):
+        # Write to a temp file then rename, so readers never see partial JSON
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _update(self, mutate):
+        """Read-modify-write the cache file under the store lock"""
+        handle = self._file_lock(self.path + ".lock")
+        try:
+            entries = self._read()
+            result = mutate(entries)
+            self._write(entries)
+            return result
+        finally:
+            handle.close()
+
+    def _lock_slot(self, key):
+        """Index of the single-flight lock shared by key (keys are hex digests)"""
+        return int(key[:8], 16) % LOCK_SLOTS
+
+    def _expired(self, entry, now):
+        return now - entry.get("created_at", 0) > self.ttl_seconds
+
+    # ----- public API -----
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing/expired"""
+        now = time.time()
+
+        def lookup(entries):
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, now):
+                del entries[key]
+                return None
+            entry["last_used"] = now
+            return entry["value"]
+
+        if key not in self._read():
+            return None
+        return self._update(lookup)
+
+    def put(self, key, value):
+        """Store value for key, dropping expired and least recently used entries"""
+        now = time.time()
+
+        def store(entries):
+            for stale in [k for k, e in entries.items() if self._expired(e, now)]:
+                del entries[stale]
+            entries[key] = {"value": value, "created_at": now, "last_used": now}
+            overflow = len(entries) - self.max_entries
+            if overflow > 0:
+                by_age = sorted(entries, key=lambda k: entries[k]["last_used"])
+                for old_key in by_age[:overflow]:
+                    del entries[old_key]
+
+        self._update(store)
+
+    def clear(self):
+        """Remove all cached recommendations"""
+        self._update(lambda entries: entries.clear())
+
+    def get_or_compute(self, summary_data, compute, namespace=""):
+        """
+        Return cached recommendations for summary_data, or run compute() once
+        Other threads/processes asking for the same key wait for that result
+        compute: callable returning the value; falsy results are not cached
+        """
+        key = cache_key(summary_data, namespace)
+        value = self.get(key)
+        if value is not None:
+            print("✅ Recommendation cache hit", file=sys.stderr)
+            return value
+
+        # Single-flight: one lock per key slot, in-process and across processes
+        slot = self._lock_slot(key)
+        with self._slot_locks[slot]:
+            lock_dir = os.path.join(os.path.dirname(self.path), "locks")
+            handle = self._file_lock(os.path.join(lock_dir, f"{slot}.lock"))
+            try:
+                # Another request may have finished while we were waiting
+                value = self.get(key)
+                if value is not None:
+                    print("✅ Recommendation cache hit (coalesced)", file=sys.stderr)
+                    return value
+
+                value = compute()
+                if value:
+                    self.put(key, value)
+                return value
+            finally:
+                handle.close()
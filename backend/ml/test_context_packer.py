@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Checks for RAG context packing
+Repeated logs that differ only in timestamp/hash must collapse into one
+entry, distinct logs must not, and the reported count must cover only the
+logs that fit in the token budget. Runs offline on the stub backend; the
+MiniLM check is skipped unless the model is available locally.
+
+Usage:
+    python3 test_context_packer.py
+    python3 -m pytest test_context_packer.py
+"""
+
+import sys
+
+import pytest
+
+import model_backends
+from context_packer import pack_context
+from model_backends import StubBackend, StubEmbeddingModel, load_local_embedding_model
+import generate_rag_report as rag
+from benchmark_report_pipeline import QUERY, synthetic_activities
+
+count_tokens = StubBackend().count_tokens
+
+
+@pytest.fixture
+def stub_backend(monkeypatch):
+    """Run the RAG pipeline on the offline stub backend for one test"""
+    monkeypatch.setattr(model_backends, "DEFAULT_BACKEND", "stub")
+    for name in ("embedding_model", "llm_backend", "knn_index", "df_rag"):
+        monkeypatch.setattr(rag, name, None)
+
+
+def repeated_logs(n, **overrides):
+    """n logs of one event, differing only in timestamp and blockchain hash"""
+    log = {
+        "type": "scan",
+        "service": "أبشر",
+        "location": "Riyadh",
+        "region": "Riyadh",
+        "status": "rejected",
+        "riskLevel": "High",
+    }
+    log.update(overrides)
+    return [
+        dict(
+            log,
+            timestamp=f"2025-12-01T10:{i:02d}:00+00:00",
+            blockchainHash=f"0x{i:032x}",
+        )
+        for i in range(n)
+    ]
+
+
+def check_collapse(embed):
+    records = repeated_logs(5) + repeated_logs(3, service="توكلنا", status="verified")
+    context_str, covered = pack_context(records, embed, count_tokens, 10_000)
+    lines = context_str.split("\n")
+    assert len(lines) == 2, lines
+    assert "count: 5" in lines[0] and "time range:" in lines[0], lines[0]
+    assert "count: 3" in lines[1], lines[1]
+    assert covered == len(records)
+
+
+def test_repeated_logs_collapse():
+    check_collapse(StubEmbeddingModel().encode)
+    check_collapse(None)
+
+
+def test_budget_reports_covered_logs():
+    records = repeated_logs(4) + [
+        dict(r, service=f"service {i}") for i, r in enumerate(repeated_logs(6))
+    ]
+    _, covered = pack_context(
+        records, StubEmbeddingModel().encode, count_tokens, token_budget=60
+    )
+    assert 0 < covered < len(records), covered
+
+
+def test_report_counts_packed_logs(stub_backend):
+    # Synthetic activities repeat events, so retrieved logs must collapse
+    activities = synthetic_activities(2000)
+    rag.prepare_data(activities)
+    retrieved = rag.search_relevant_logs(QUERY, k=32)
+    context_str, covered = rag.build_context(retrieved)
+    entries = context_str.count("\n") + 1
+    print(f"{len(retrieved)} retrieved logs -> {entries} entries, {covered} covered")
+    assert entries < len(retrieved)
+
+    result = rag.run_rag_report(QUERY, activities, k=32)
+    assert result["success"], result
+    assert result["retrieved_count"] == covered
+
+
+def test_repeated_logs_collapse_with_minilm():
+    model = load_local_embedding_model(rag.EMBEDDING_MODEL)
+    if model is None:
+        pytest.skip("MiniLM not available locally")
+    check_collapse(lambda texts: model.encode(texts, show_progress_bar=False))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main(["-q", "-rs", __file__]))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Cold-import regression check for the ShadowID ML entry points
+Fails if importing an entry point (or running it with --help) in a fresh
+interpreter takes longer than SHADOWID_IMPORT_TIME_BUDGET seconds (default
+0.5), i.e. if a heavy dependency is imported at module top again.
+
+Usage:
+    python3 test_import_time.py
+    python3 -m pytest test_import_time.py
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+from ml_common import SCRIPT_DIR
+from profile_imports import ENTRY_POINTS
+
+IMPORT_TIME_BUDGET = float(os.environ.get("SHADOWID_IMPORT_TIME_BUDGET", "0.5"))
+
+# Runs per measurement; the fastest one is compared (filters out disk/OS noise)
+RUNS = 3
+
+# Modules an entry point must not import before it needs them
+HEAVY_MODULES = (
+    "numpy",
+    "pandas",
+    "sklearn",
+    "tensorflow",
+    "torch",
+    "transformers",
+    "sentence_transformers",
+)
+
+
+def cold_run_seconds(args):
+    """Fastest wall time of running the interpreter with args, in SCRIPT_DIR"""
+    best = float("inf")
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + args,
+            cwd=SCRIPT_DIR,
+            check=True,
+            capture_output=True,
+        )
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_cold_import_time():
+    baseline = cold_run_seconds(["-c", "pass"])
+    for module in ENTRY_POINTS:
+        seconds = cold_run_seconds(["-c", f"import {module}"]) - baseline
+        print(f"import {module}: {seconds:.3f}s")
+        assert (
+            seconds <= IMPORT_TIME_BUDGET
+        ), f"import {module} took {seconds:.3f}s (budget {IMPORT_TIME_BUDGET}s)"
+
+
+def test_help_is_fast():
+    baseline = cold_run_seconds(["-c", "pass"])
+    for module in ENTRY_POINTS:
+        seconds = cold_run_seconds([f"{module}.py", "--help"]) - baseline
+        print(f"{module}.py --help: {seconds:.3f}s")
+        assert (
+            seconds <= IMPORT_TIME_BUDGET
+        ), f"{module}.py --help took {seconds:.3f}s (budget {IMPORT_TIME_BUDGET}s)"
+
+
+def test_no_heavy_imports():
+    check = (
+        "import sys, {module}; "
+        "print(','.join(m for m in {heavy!r} if m in sys.modules))"
+    )
+    for module in ENTRY_POINTS:
+        result = subprocess.run(
+            [sys.executable, "-c", check.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=SCRIPT_DIR,
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        loaded = result.stdout.strip()
+        assert not loaded, f"import {module} loaded heavy modules: {loaded}"
+
+
+if __name__ == "__main__":
+    print(f"Import time budget: {IMPORT_TIME_BUDGET}s", file=sys.stderr)
+    failed = False
+    for test in (test_no_heavy_imports, test_cold_import_time, test_help_is_fast):
+        try:
+            test()
+            print(f"✅ {test.__name__}", file=sys.stderr)
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}", file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -2,6 +2,7 @@
 """
 Test script for generate_recommendations.py
 Run this manually to test the recommendations generation
+Offline (canned text, no model download): SHADOWID_MODEL_BACKEND=stub python3 test_recommendations.py
 """
 
 import json
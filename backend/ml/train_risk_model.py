@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Training & export CLI for the Shadow ID risk models
+Rebuilds the artifacts assess_risk.py loads (scaler, autoencoder/encoder,
+RandomForest, feature names, label mapping) from the dataset CSV, searching
+forest size and depth against an inference-latency budget and an accuracy bar.
+Writes a manifest with the measured latency and metrics of every candidate.
+
+Usage:
+    python3 train_risk_model.py [--latency-budget-ms 5] [--min-accuracy 0.9]
+                                [--epochs 50] [--jobs -1] [--output-dir DIR]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score
+
+from ml_common import SCRIPT_DIR, MODELS_DIR
+
+DATASET_PATH = os.path.join(
+    SCRIPT_DIR,
+    "../../DeepLearning_Classification/Dataset/shadow_id_v2_English_Dataset.csv",
+)
+
+# Artifact file names (as expected by assess_risk.py)
+SCALER_FILE = "shadow_id_scaler.pkl"
+AUTOENCODER_FILE = "shadow_id_autoencoder.keras"
+ENCODER_FILE = "shadow_id_encoder.keras"
+CLASSIFIER_FILE = "shadow_id_risk_classifier_rf.pkl"
+FEATURE_NAMES_FILE = "shadow_id_feature_names.json.json"
+LABEL_MAPPING_FILE = "shadow_id_label_mapping.json.json"
+MANIFEST_FILE = "shadow_id_model_manifest.json"
+
+RISK_MAPPING = {"Low": 0, "Medium": 1, "High": 2}
+
+# Columns that are not model features
+DROP_COLS = [
+    "RowID",
+    "NameShort",
+    "Phone",
+    "IDNumber",
+    "TokenId",
+    "DeviceId",
+    "RiskReason",  # text for the LLM only
+    "StateArabic",  # Arabic copy of State
+    "RiskLabel",  # label
+]
+DATE_COLS = ["IssueDate", "ExpiryDate", "TokenStartTime", "TokenEndTime", "UsageTime"]
+CATEGORICAL_COLS = ["PersonType", "Nationality", "Location", "FraudType", "State"]
+
+ENCODING_DIM = 16
+
+# Forest search space
+N_ESTIMATORS_GRID = (25, 50, 100, 200)
+MAX_DEPTH_GRID = (8, 12, 16, None)
+
+# Single-row inference timing
+LATENCY_REPEATS = 200
+
+
+def load_dataset(path):
+    """Load the CSV and add the engineered time features"""
+    df = pd.read_csv(path, encoding="utf-8-sig")
+
+    existing_date_cols = [c for c in DATE_COLS if c in df.columns]
+    for c in existing_date_cols:
+        df[c] = pd.to_datetime(df[c])
+
+    df["TimeFromStartMin"] = (
+        df["UsageTime"] - df["TokenStartTime"]
+    ).dt.total_seconds() / 60.0
+    df["IsExpiredAtUse"] = (df["UsageTime"] > df["TokenEndTime"]).astype(int)
+    df["TokenStartHour"] = df["TokenStartTime"].dt.hour
+    df["UsageHour"] = df["UsageTime"].dt.hour
+    df["UsageWeekday"] = df["UsageTime"].dt.weekday
+
+    return df, existing_date_cols
+
+
+def build_features(df, date_cols):
+    """Drop non-features and one-hot encode, returning (X, feature_names)"""
+    drop_cols = [c for c in DROP_COLS + date_cols if c in df.columns]
+    df_features = df.drop(columns=drop_cols)
+    cat_cols = [c for c in CATEGORICAL_COLS if c in df_features.columns]
+    df_model = pd.get_dummies(df_features, columns=cat_cols, drop_first=True)
+    return df_model.values.astype(np.float32), df_model.columns.tolist()
+
+
+def train_autoencoder(X_train_scaled, epochs, seed):
+    """Train the autoencoder, returning (autoencoder, encoder, history)"""
+    import tensorflow as tf
+    from tensorflow import keras
+    from tensorflow.keras import layers
+
+    tf.random.set_seed(seed)
+    input_dim = X_train_scaled.shape[1]
+
+    input_layer = keras.Input(shape=(input_dim,), name="input")
+    encoded = layers.Dense(64, activation="relu")(input_layer)
+    encoded = layers.Dense(32, activation="relu")(encoded)
+    bottleneck = layers.Dense(ENCODING_DIM, activation="relu", name="risk_embedding")(
+        encoded
+    )
+    decoded = layers.Dense(32, activation="relu")(bottleneck)
+    decoded = layers.Dense(64, activation="relu")(decoded)
+    output_layer = layers.Dense(input_dim, activation="linear")(decoded)
+
+    autoencoder = keras.Model(
+        inputs=input_layer, outputs=output_layer, name="shadow_id_autoencoder"
+    )
+    autoencoder.compile(optimizer="adam", loss="mse")
+    history = autoencoder.fit(
+        X_train_scaled,
+        X_train_scaled,
+        epochs=epochs,
+        batch_size=64,
+        validation_split=0.2,
+        verbose=0,
+    )
+
+    encoder = keras.Model(
+        inputs=autoencoder.input,
+        outputs=autoencoder.get_layer("risk_embedding").output,
+        name="shadow_id_encoder",
+    )
+    return autoencoder, encoder, history
+
+
+def measure_latency_ms(predict, row, repeats=LATENCY_REPEATS):
+    """p50/p95 wall time (ms) of predict(row) on a single row"""
+    predict(row)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(row)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "p50": round(float(np.percentile(timings, 50)), 4),
+        "p95": round(float(np.percentile(timings, 95)), 4),
+    }
+
+
+def search_forest(Z_train, y_train, Z_test, y_test, jobs, seed):
+    """Train every forest in the grid, measuring accuracy and latency"""
+    candidates = []
+    for n_estimators in N_ESTIMATORS_GRID:
+        for max_depth in MAX_DEPTH_GRID:
+            clf = RandomForestClassifier(
+                n_estimators=n_estimators,
+                max_depth=max_depth,
+                random_state=seed,
+                class_weight="balanced",
+                n_jobs=jobs,
+            )
+            clf.fit(Z_train, y_train)
+
+            # assess_risk scores one row at a time, where extra jobs only add overhead
+            clf.set_params(n_jobs=1)
+            y_pred = clf.predict(Z_test)
+            latency = measure_latency_ms(clf.predict_proba, Z_test[:1])
+
+            candidate = {
+                "n_estimators": n_estimators,
+                "max_depth": max_depth,
+                "accuracy": round(float(accuracy_score(y_test, y_pred)), 4),
+                "macro_f1": round(float(f1_score(y_test, y_pred, average="macro")), 4),
+                "latency_ms": latency,
+            }
+            candidates.append((candidate, clf))
+            print(
+                f"  trees={n_estimators:<4} depth={str(max_depth):<5}"
+                f" acc={candidate['accuracy']:.4f} p95={latency['p95']:.3f}ms",
+                file=sys.stderr,
+            )
+    return candidates
+
+
+def select_model(candidates, latency_budget_ms, min_accuracy):
+    """Fastest candidate meeting both the accuracy bar and the latency budget"""
+    eligible = [
+        (candidate, clf)
+        for candidate, clf in candidates
+        if candidate["accuracy"] >= min_accuracy
+        and candidate["latency_ms"]["p95"] <= latency_budget_ms
+    ]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda c: (c[0]["latency_ms"]["p95"], -c[0]["accuracy"]))
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def export(output_dir, scaler, autoencoder, encoder, clf, feature_names):
+    """Write all artifacts into output_dir, returning their paths"""
+    paths = {
+        "scaler": os.path.join(output_dir, SCALER_FILE),
+        "autoencoder": os.path.join(output_dir, AUTOENCODER_FILE),
+        "encoder": os.path.join(output_dir, ENCODER_FILE),
+        "classifier": os.path.join(output_dir, CLASSIFIER_FILE),
+        "feature_names": os.path.join(output_dir, FEATURE_NAMES_FILE),
+        "label_mapping": os.path.join(output_dir, LABEL_MAPPING_FILE),
+    }
+    joblib.dump(scaler, paths["scaler"])
+    autoencoder.save(paths["autoencoder"])
+    encoder.save(paths["encoder"])
+    joblib.dump(clf, paths["classifier"])
+    with open(paths["feature_names"], "w") as f:
+        json.dump(feature_names, f)
+    with open(paths["label_mapping"], "w") as f:
+        json.dump(RISK_MAPPING, f)
+    return paths
+
+
+def publish(output_dir, paths, manifest_path):
+    """
+    Move staged artifacts into output_dir, the manifest last
+    A running `assess_risk.py --serve` keys its models on the manifest
+    version, so it only reloads once every new artifact is in place
+    """
+    for path in list(paths.values()) + [manifest_path]:
+        os.replace(path, os.path.join(output_dir, os.path.basename(path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--output-dir", default=MODELS_DIR)
+    parser.add_argument(
+        "--latency-budget-ms",
+        type=float,
+        default=5.0,
+        help="p95 single-row forest inference budget",
+    )
+    parser.add_argument("--min-accuracy", type=float, default=0.9)
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument(
+        "--jobs", type=int, default=-1, help="parallel jobs for forest training"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"Loading dataset: {args.dataset}", file=sys.stderr)
+    df, date_cols = load_dataset(args.dataset)
+    X, feature_names = build_features(df, date_cols)
+    print(f"✅ {X.shape[0]} rows, {X.shape[1]} features", file=sys.stderr)
+
+    # Scaler + autoencoder (unsupervised)
+    X_train, _ = train_test_split(X, test_size=0.2, random_state=args.seed)
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+
+    print(f"Training autoencoder ({args.epochs} epochs)...", file=sys.stderr)
+    autoencoder, encoder, history = train_autoencoder(
+        X_train_scaled, args.epochs, args.seed
+    )
+    print("✅ Autoencoder trained", file=sys.stderr)
+
+    # Embeddings + labels for the classifier
+    Z_all = encoder.predict(scaler.transform(X), verbose=0)
+    y_all = df["RiskLabel"].map(RISK_MAPPING).values
+    Z_train, Z_test, y_train, y_test = train_test_split(
+        Z_all, y_all, test_size=0.2, random_state=args.seed, stratify=y_all
+    )
+
+    print("Searching forest size/depth...", file=sys.stderr)
+    candidates = search_forest(Z_train, y_train, Z_test, y_test, args.jobs, args.seed)
+    selected = select_model(candidates, args.latency_budget_ms, args.min_accuracy)
+    if selected is None:
+        print(
+            f"❌ No forest reaches accuracy >= {args.min_accuracy} within "
+            f"{args.latency_budget_ms}ms p95; nothing exported",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    chosen, clf = selected
+    print(
+        f"✅ Selected trees={chosen['n_estimators']} depth={chosen['max_depth']}",
+        file=sys.stderr,
+    )
+
+    # Full scoring path as assess_risk.py runs it: scaler -> encoder -> forest
+    row = X[:1]
+    end_to_end = measure_latency_ms(
+        lambda r: clf.predict_proba(encoder.predict(scaler.transform(r), verbose=0)),
+        row,
+        repeats=50,
+    )
+
+    # Stage next to the live models (same filesystem, so os.replace is atomic)
+    os.makedirs(args.output_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=".export-", dir=args.output_dir)
+    try:
+        paths = export(staging_dir, scaler, autoencoder, encoder, clf, feature_names)
+        manifest = {
+            # Changes whenever the exported classifier changes
+            "version": file_sha256(paths["classifier"])[:12],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "dataset": {
+                "path": os.path.basename(args.dataset),
+                "sha256": file_sha256(args.dataset),
+                "rows": int(X.shape[0]),
+            },
+            "features": len(feature_names),
+            "autoencoder": {
+                "epochs": args.epochs,
+                "encoding_dim": ENCODING_DIM,
+                "loss": round(float(history.history["loss"][-1]), 6),
+                "val_loss": round(float(history.history["val_loss"][-1]), 6),
+            },
+            "selection": {
+                "latency_budget_ms": args.latency_budget_ms,
+                "min_accuracy": args.min_accuracy,
+            },
+            "classifier": chosen,
+            "end_to_end_latency_ms": end_to_end,
+            "candidates": [candidate for candidate, _ in candidates],
+            "artifacts": {name: os.path.basename(path) for name, path in paths.items()},
+        }
+        manifest_path = os.path.join(staging_dir, MANIFEST_FILE)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        publish(args.output_dir, paths, manifest_path)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    print(f"✅ Exported artifacts to {args.output_dir}", file=sys.stderr)
+    print(json.dumps(manifest["classifier"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -394,6 +394,7 @@ export class ReportController {
     const sevenDaysAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000);
     const activities = await activityRepo
       .createQueryBuilder("activity")
+      .leftJoinAndSelect("activity.shadowId", "shadowId")
       .where("activity.timestamp >= :sevenDaysAgo", { sevenDaysAgo })
       .andWhere("activity.status IN (:...statuses)", {
         statuses: ["rejected", "verified"],
@@ -412,6 +413,7 @@ export class ReportController {
       timestamp: activity.timestamp.toISOString(),
       riskLevel: activity.shadowId?.riskLevel || "Low",
       blockchainHash: activity.blockchainHash || "",
+      deviceFingerprint: activity.shadowId?.deviceFingerprint || "",
     }));
 
     // Prepare query based on report type